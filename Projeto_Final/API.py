@@ -1,40 +1,373 @@
 import json
-from http.server import BaseHTTPRequestHandler
+import select
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from solver import SOLVERS
+
+# número de sudokus de um pedido /solve/batch que são resolvidos ao mesmo tempo
+BATCH_WORKERS = 8
+# pedidos /solve (ou /solve/batch) em curso ao mesmo tempo, os restantes são recusados com 503
+MAX_SOLVES = 8
+# threads que atendem as ligações HTTP, além das usadas pelos pedidos de resolução
+MONITOR_WORKERS = 8
+# tempo (s) que uma ligação keep-alive pode ficar parada antes de ser fechada
+KEEPALIVE_TIMEOUT = 5
+# intervalo (s) entre verificações de que o cliente de um pedido de resolução ainda está ligado
+DISCONNECT_POLL = 0.2
+
+def parse_batch(body: bytes) -> list:
+    """Solve requests of a /solve/batch body, either a JSON array or NDJSON (one JSON per
+    line). Each item may be a grid or an object like the /solve body."""
+    text = body.decode('utf-8')
+    try:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            items = [items]
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    requests = [item if isinstance(item, dict) else {"sudoku": item} for item in items]
+    for request in requests:
+        check_request(request)
+    return requests
+
+def check_request(request: dict):
+    """Raise ValueError if a solve request has no grid, a bad timeout_ms or an unknown solver."""
+    if "sudoku" not in request:
+        raise ValueError("Missing sudoku")
+    if request.get("solver") is not None and request["solver"] not in SOLVERS:
+        raise ValueError(f"Unknown solver, expected one of {list(SOLVERS)}")
+    timeout_ms = request.get("timeout_ms")
+    if timeout_ms is not None and (isinstance(timeout_ms, bool) or not isinstance(timeout_ms, (int, float)) or timeout_ms <= 0):
+        raise ValueError("timeout_ms must be a positive number")
+
+class APIServer(HTTPServer):
+    """HTTP server that handles the connections in a bounded thread pool.
+
+    At most 'max_solves' solve requests run at a time, so there are always threads left
+    for /stats and /network. A thread only holds a connection while it answers requests:
+    idle keep-alive connections wait in a selector until the next request arrives and are
+    closed after KEEPALIVE_TIMEOUT. The time each dispatch waits for a thread is recorded.
+    """
+
+    def __init__(self, address, handler, max_solves=MAX_SOLVES, workers=None):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(workers or max_solves + MONITOR_WORKERS)
+        self.solves = threading.BoundedSemaphore(max_solves)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.connections = 0
+        self.dispatches = 0
+        self.queue_total = 0.0
+        self.queue_max = 0.0
+        # ligações keep-alive à espera do próximo pedido, sem thread
+        self.parked = []
+        self.closing = False
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_send.setblocking(False)
+        self.idle_thread = threading.Thread(target=self.watch_idle, daemon=True)
+        self.idle_thread.start()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        self.pool.submit(self.process_request_thread, request, client_address, time.monotonic())
+
+    def process_request_thread(self, request, client_address, queued):
+        self.record_wait(queued)
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self.keep(handler)
+
+    def resume(self, handler, queued):
+        """Answer the next requests of a parked connection."""
+        self.record_wait(queued)
+        try:
+            handler.handle()
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            handler.finish()
+        self.keep(handler)
+
+    def keep(self, handler):
+        """Park a keep-alive connection until its next request, or close it."""
+        if getattr(handler, 'close_connection', True):
+            self.shutdown_request(handler.request)
+            return
+        with self.lock:
+            self.parked.append((handler, time.monotonic()))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_send.send(b'\0')
+        except OSError:
+            # já há um aviso por ler (ou o servidor fechou)
+            pass
+
+    def close_handler(self, handler):
+        handler.close_connection = True
+        handler.finish()
+        self.shutdown_request(handler.request)
+
+    def watch_idle(self):
+        """Hand the parked connections that become readable back to the pool and close
+        the ones idle for longer than KEEPALIVE_TIMEOUT."""
+        idle = selectors.DefaultSelector()
+        idle.register(self.wakeup_recv, selectors.EVENT_READ)
+        while True:
+            with self.lock:
+                parked, self.parked = self.parked, []
+                closing = self.closing
+            for handler, since in parked:
+                idle.register(handler.request, selectors.EVENT_READ, (handler, since + KEEPALIVE_TIMEOUT))
+            if closing:
+                break
+            deadlines = [key.data[1] for key in idle.get_map().values() if key.data]
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for key, _ in idle.select(timeout):
+                if key.data is None:
+                    self.wakeup_recv.recv(4096)
+                    continue
+                idle.unregister(key.fileobj)
+                try:
+                    self.pool.submit(self.resume, key.data[0], time.monotonic())
+                except RuntimeError:
+                    # o pool já foi desligado
+                    self.close_handler(key.data[0])
+            now = time.monotonic()
+            for key in list(idle.get_map().values()):
+                if key.data and key.data[1] <= now:
+                    idle.unregister(key.fileobj)
+                    self.close_handler(key.data[0])
+        for key in list(idle.get_map().values()):
+            if key.data:
+                self.close_handler(key.data[0])
+        idle.close()
+
+    def record_wait(self, queued):
+        waited = time.monotonic() - queued
+        with self.lock:
+            self.dispatches += 1
+            self.queue_total += waited
+            self.queue_max = max(self.queue_max, waited)
+
+    def admit(self):
+        """Take a solve slot, False if all of them are in use."""
+        if not self.solves.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.solves.release()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "connections": self.connections,
+                "dispatches": self.dispatches,
+                "queue_time": {
+                    "avg": self.queue_total / self.dispatches if self.dispatches else 0.0,
+                    "max": self.queue_max,
+                },
+            }
+
+    def server_close(self):
+        super().server_close()
+        with self.lock:
+            self.closing = True
+        self.wake()
+        self.idle_thread.join()
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+        self.pool.shutdown(wait=False)
 
 class api(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantém as ligações abertas entre pedidos (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
 
     def __init__(self, p2p, *args, **kwargs):
         self.p2p = p2p
         super().__init__(*args, **kwargs)
 
+    def handle(self):
+        """Answer the requests already sent on the connection; APIServer waits for the next
+        ones without holding a thread."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.buffered():
+            self.handle_one_request()
+
+    def finish(self):
+        # uma ligação keep-alive continua aberta à espera do próximo pedido
+        if self.close_connection:
+            super().finish()
+        else:
+            self.wfile.flush()
+
+    def buffered(self) -> bool:
+        """True if the next request (or part of it) already arrived, without waiting."""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
     def do_GET(self):
         print("Handling GET request")
         if self.path.startswith('/stats'):
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(self.p2p.stats()).encode('utf-8'))
+            stats = self.p2p.stats()
+            stats["http"] = self.server.metrics()
+            self.send_json(stats)
         elif self.path.startswith('/network'):
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(self.p2p.network()).encode('utf-8'))
+            self.send_json(self.p2p.network())
         else:
             self.send_error(404, 'Not Found')
 
     def do_POST(self):
-        if self.path.startswith('/solve'):
-            content_length = int(self.headers['Content-Length'])
-            post_data = json.loads(self.rfile.read(content_length))
-            sudoku,duration = self.p2p.solve_api(post_data)
-            self.p2p.num_solve_counter()
-            # Handle post_data as needed
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+        if not self.path.startswith('/solve'):
+            self.send_error(404, 'Not Found')
+            return
+        content_length = int(self.headers['Content-Length'])
+        body = self.rfile.read(content_length)
+        if not self.server.admit():
+            self.send_response(503)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
             self.end_headers()
-            response_data = {'sudoku': sudoku, 'time': duration}
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            return
+        try:
+            if self.path.startswith('/solve/batch'):
+                self.solve_batch(body)
+            else:
+                self.solve(body)
+        finally:
+            self.server.release()
 
-        else:
-            self.send_error(404, 'Not Found')
-        
\ No newline at end of file
+    def solve(self, body: bytes):
+        try:
+            post_data = json.loads(body)
+            check_request(post_data)
+        except (ValueError, TypeError, AttributeError):
+            self.send_error(400, 'Bad Request')
+            return
+        future = self.p2p.solve_future(post_data)
+        while True:
+            try:
+                result = future.result(timeout=DISCONNECT_POLL)
+                break
+            except FutureTimeout:
+                # o cliente desistiu: cancela a pesquisa em toda a rede
+                if self.client_gone():
+                    future.cancel()
+                    self.close_connection = True
+                    return
+        # Handle post_data as needed
+        response_data = {'sudoku': result['sudoku'], 'time': result['time'], 'validations': result['validations'],
+                         'preflight': result['preflight']}
+        if result['preflight']['status'] == 'invalid':
+            response_data['error'] = result['preflight']['error']
+            self.send_json(response_data, 400)
+            return
+        if result['timed_out']:
+            response_data['error'] = 'Timeout'
+            self.send_json(response_data, 408)
+            return
+        self.send_json(response_data)
+        # só conta como resolvido um sudoku cuja solução foi entregue ao cliente
+        if result['sudoku']:
+            self.p2p.num_solve_counter()
+
+    def client_gone(self) -> bool:
+        """True if the client closed the connection."""
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self.connection.recv(1, socket.MSG_PEEK) == b''
+        except OSError:
+            return True
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def solve_batch(self, body: bytes):
+        """Solve many sudokus at once, streaming one NDJSON line per sudoku as soon as it
+        is solved. Lines carry the index of the sudoku in the request."""
+        try:
+            requests = parse_batch(body)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.send_error(400, 'Bad Request')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        # no máximo BATCH_WORKERS sudokus do pedido em resolução ao mesmo tempo
+        pending = {}
+        items = iter(enumerate(requests))
+        def fill():
+            for index, request in items:
+                pending[self.p2p.solve_future(request)] = index
+                if len(pending) >= BATCH_WORKERS:
+                    break
+
+        fill()
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=DISCONNECT_POLL, return_when=FIRST_COMPLETED)
+                if not done and self.client_gone():
+                    raise ConnectionError("Client disconnected")
+                for future in done:
+                    index = pending.pop(future)
+                    result = future.result()
+                    line = {'index': index, 'sudoku': result['sudoku'], 'time': result['time'],
+                            'validations': result['validations'], 'preflight': result['preflight']}
+                    if result['preflight']['status'] == 'invalid':
+                        line['error'] = result['preflight']['error']
+                    if result['timed_out']:
+                        line['error'] = 'Timeout'
+                    self.write_chunk((json.dumps(line) + '\n').encode('utf-8'))
+                    if result['sudoku'] and not result['timed_out']:
+                        self.p2p.num_solve_counter()
+                fill()
+            self.write_chunk(b'')
+        except ConnectionError:
+            # o cliente desistiu: cancela os sudokus que ainda estão a ser resolvidos
+            for future in pending:
+                future.cancel()
+            self.close_connection = True
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
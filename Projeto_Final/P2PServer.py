@@ -1,38 +1,114 @@
+import asyncio
 import socket
 import threading
-import pickle
 from log import get_logger
 import time 
 import random
+from collections import deque
+from fractions import Fraction
 
 from Protocol import CDProto,CDProtoBadFormat
-from sudoku import Sudoku
+import codec
+from counters import ClusterStats
+from membership import FailureDetector, Membership
+from cache import HashRing, SolutionCache, canonical_form, canonical_solution, decode_solution, encode_solution
+from procpool import ProcessSolver
+from scheduler import CostModel, WorkQueue, new_task, split_task
+from solver import get_solver, is_solution, preflight
+from transport import Outbox, Reassembler, SeenSet, fragment
+
+# número de partições do sudoku por cada nó da rede
+PARTITIONS_PER_NODE = 4
+# abaixo deste número de tarefas na fila o nó divide a próxima tarefa em SPLIT_FACTOR partes
+LOW_WATER = 2
+SPLIT_FACTOR = 4
+# intervalo (s) entre pedidos de roubo de trabalho de um nó sem tarefas
+STEAL_INTERVAL = 0.2
+# tempo máximo (s) à espera da cache do nó dono de um sudoku
+CACHE_TIMEOUT = 0.005
+# número máximo de saltos de uma mensagem difundida pela rede
+BROADCAST_TTL = 16
+# intervalo (s) entre mensagens alive
+ALIVE_INTERVAL = 1
+# silêncio (s) de um vizinho até passar a suspeito, e tempo (s) como suspeito até ser dado como morto
+SUSPECT_TIMEOUT = 3
+DEAD_TIMEOUT = 3
+# número de vizinhos a quem se pede para testar um suspeito (ping_req)
+PROBE_FANOUT = 2
+# tempo (s) sem o heartbeat de um nó aumentar até sair da rede
+MEMBER_TIMEOUT = 10
+# tempo máximo (s) à espera da resposta da rede ao /network
+NETWORK_TIMEOUT = 5
+# prazo (ms) dos pedidos sem timeout_ms: o peso perdido num datagrama ou num nó que
+# falhou nunca volta ao coordenador, e sem prazo o pedido ficava à espera para sempre
+SOLVE_TIMEOUT_MS = 60000
+
+
+class NodeProtocol(asyncio.DatagramProtocol):
+    """Hands the datagrams received by the node's socket to the P2PServer."""
+
+    def __init__(self, node):
+        self.node = node
+
+    def datagram_received(self, data, addr):
+        self.node.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        self.node.error_received(exc)
+
 
 class P2PServer(threading.Thread):
 
-    def __init__(self, address, join_addr, handicap,timeout=3):
+    def __init__(self, address, join_addr, handicap, solver="propagation", workers=1, cache_size=16 * 1024 * 1024, wire="binary",
+                 solve_timeout_ms=SOLVE_TIMEOUT_MS):
         threading.Thread.__init__(self)
         #self.count = 0
         self.addr = address
         self.join_addr = join_addr
+        # atraso (ms) de cada validação
         self.handicap = handicap
+        self.solver = solver
+        self.solve_timeout_ms = solve_timeout_ms
+        # com mais de um processo a pesquisa de cada tarefa é dividida por um pool de processos
+        self.pool = ProcessSolver(workers, solver, handicap / 1000) if workers > 1 else None
+        self.cost = CostModel()
+        self.cache = SolutionCache(cache_size)
+        self.cache_events = {}
+        self.ring = None
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(timeout)
         self.logger = get_logger("")
         self.logger.info(f"Initializing node")
-        self.nodes_stats = {}
         self.connections = []
-        self.num_nodes = 1
+        # contadores de validações/resolvidos da rede, criados quando o endereço é conhecido
+        self.cluster = None
+        # membros da rede, criados quando o endereço é conhecido, e deteção de falhas dos vizinhos
+        self.members = None
+        self.detector = FailureDetector(SUSPECT_TIMEOUT, DEAD_TIMEOUT)
         self.validations = 0
         self.num_solved = 0
-        self.lost_con = False
-        self.last_sent_addr = address
+        # o nó corre num event loop asyncio, criado pelo run()
+        self.loop = None
+        self.transport = None
+        self.ready = threading.Event()
+        self.outbox = Outbox()
+        # codecs que este nó lê e o codec negociado com cada vizinho (binário por omissão,
+        # também no pedido de entrada e com os nós que não são vizinhos)
+        self.codecs = (codec.BINARY, codec.PICKLE) if wire == codec.BINARY else (codec.PICKLE,)
+        self.peer_codecs = {}
+        self.reassembler = Reassembler()
+        self.fragment_id = 0
         self.request_id = 0
+        self.request_lock = threading.Lock()
+        self.broadcast_seq = 0
+        self.seen = SeenSet()
 
-        self.stats_events = {}
         self.network_events = {}
         self.solve_events = {}
         self.solve_api_events = {}
+        self.credits = {}
+        self.credits_lock = threading.Lock()
+        self.work = WorkQueue()
+        self.finished = deque(maxlen=1000)
 
     # def divide_sudoku(self) -> List[List[List[int]]]:
     #     """Divide o Sudoku original em subgrids para distribuição entre os nós."""
@@ -49,142 +125,154 @@ class P2PServer(threading.Thread):
 
 #------------------------------------- funções de envio e receção de mensagens-----------------------------------------
     def send(self, address, msg):
-        """ Send msg to address. """           
-        # if address not in self.connections:
-        #     # Encaminha a mensagem para o próximo nó na lista de conexões se necessário
-        #     next_node = self.connections[self.connections.index(address) + 1] if address in self.connections else None
-        #     if next_node:
-        #         self.send(next_node, msg)
-        #         return
-        send = True
-        if self.lost_con:
-            send = False
-            com = msg["command"]
-            if com == "node_req" or com == "node_ans" or com == "node_down" or com == "update" or com == "alive":
-                send = True
-        
-        while self.lost_con and not send:
-            pass
-        
-        payload = pickle.dumps(msg)
-        self.last_sent_addr = address
-        self.socket.sendto(payload, address)
-        self.logger.info(f"[SENT TO]: {address}, [MSG]: {str(msg)}")
-        
-    def recv(self):
-        """ Retrieve msg payload and from address."""
-        try:
-            payload, addr = self.socket.recvfrom(1024)
-        except socket.timeout:
-            return None, None
-        except (ConnectionResetError, OSError) as e:
-            self.lost_con = True
-            self.logger.error(f"Connection Lost: {self.last_sent_addr}, Error: {e}")
-            self.handle_disconnection(self.last_sent_addr)
-            return None, None
-
+        """ Queue msg to address, the event loop sends it. Can be called from any thread. """
+        if not self.outbox.put(address, msg):
+            self.logger.warning(f"[DROPPED]: {address}, [MSG]: {msg['command']}")
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        """ Send the queued messages, control messages first. """
+        while True:
+            item = self.outbox.get_nowait()
+            if item is None:
+                return
+            address, msg = item
+            self.fragment_id = (self.fragment_id + 1) & 0xFFFFFFFF
+            wire = codec.BINARY if msg["command"] in codec.HANDSHAKE else self.peer_codecs.get(address, codec.BINARY)
+            try:
+                for datagram in fragment(self.fragment_id, codec.dumps(msg, wire)):
+                    self.transport.sendto(datagram, address)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.logger.error(f"Failed to send to {address}, Error: {e!r}")
+                continue
+            self.logger.info(f"[SENT TO]: {address}, [MSG]: {str(msg)}")
+
+    def datagram_received(self, payload, addr):
+        """ Rebuild the message a datagram belongs to and dispatch it once complete. """
         if len(payload) == 0:
-            return None, addr
+            return
         try:
-            dict_msg = pickle.loads(payload)
-        except pickle.UnpicklingError as err:
-            raise CDProtoBadFormat(payload)
-
-        return dict_msg, addr
+            payload = self.reassembler.add(addr, payload)
+        except ValueError as e:
+            self.logger.warning(f"[BAD FRAGMENT]: {addr}, Error: {e}")
+            return
+        # a mensagem ainda não chegou toda
+        if payload is None:
+            return
+        try:
+            # pickle só de quem o negociou, ou num nó que só fala pickle
+            allow_pickle = self.codecs == (codec.PICKLE,) or self.peer_codecs.get(addr) == codec.PICKLE
+            msg = codec.loads(payload, allow_pickle)
+        except CDProtoBadFormat:
+            self.logger.warning(f"[BAD MESSAGE]: {addr}")
+            return
+        # quem envia no formato binário também o sabe ler
+        if payload[0] == codec.MAGIC and codec.BINARY in self.codecs:
+            self.peer_codecs[addr] = codec.BINARY
+        # mensagens difundidas que já passaram por este nó são ignoradas
+        if "msg_id" in msg and not self.seen.add(msg["msg_id"]):
+            return
+        self.detector.heard(addr, time.monotonic())
+        self.logger.info(f"[FROM]: {addr}, [RECEIVED]: {str(msg)}")
+        self.handle(msg, addr)
+
+    def error_received(self, exc):
+        # o erro não diz que vizinho falhou, isso fica para o detetor de falhas
+        self.logger.warning(f"Socket error: {exc}")
     
-    def prop_messages(self, lst_addr:list):
-        lst_sendto = []
+    def broadcast(self, msg, exclude=None):
+        """ Flood msg to every connection but 'exclude', stamping it with a new id if it has none. """
+        if "msg_id" not in msg:
+            with self.request_lock:
+                self.broadcast_seq += 1
+                msg = CDProto.flood(msg, (self.addr, self.broadcast_seq), BROADCAST_TTL)
+            self.seen.add(msg["msg_id"])
         for con in self.connections:
-            if con not in lst_addr:
-                lst_sendto.append(con)
-                lst_addr.append(con)
-        return lst_addr, lst_sendto
+            if con != exclude:
+                self.send(con, msg)
+
+    def forward(self, msg, addr):
+        """ Pass on a flooded msg received from addr while it has hops left. """
+        if msg["ttl"] > 1:
+            self.broadcast(CDProto.flood(msg, msg["msg_id"], msg["ttl"] - 1), exclude=addr)
+
+    @property
+    def num_nodes(self):
+        """Number of nodes in the confirmed membership, this one included."""
+        return len(self.members) if self.members is not None else 1
 
     def handle_disconnection(self,address):
-        if address in self.connections:
-            self.connections.remove(address)
+        self.remove_node(address)
         self.logger.debug(f"[connections]: {self.connections}")
-        self.num_nodes -= 1
-        list_send = []
-        list_send += self.connections
-        list_send.append(self.addr)
-        
-        for con in self.connections:
-            self.send(con,CDProto.node_down(address,list_send).pickle())
-        
-        for con in self.connections:
-            self.send(con,CDProto.NumUpdate(self.num_nodes,list_send).pickle())
+        self.broadcast(CDProto.node_down(address).pickle())
 
-        self.lost_con = False
+    def remove_node(self, address):
+        if address in self.connections:
+            self.connections.remove(address)
+        self.detector.forget(address)
+        self.cost.forget(address)
+        self.members.remove(address, time.monotonic())
             
+    def new_request_id(self):
+        """Next request id, the HTTP handlers call it from several threads."""
+        with self.request_lock:
+            self.request_id += 1
+            return self.request_id
+
+    def call(self, coro):
+        """Run a coroutine in the node's event loop from another thread, e.g. an HTTP
+        handler, and wait for its result."""
+        self.ready.wait()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def resolve(self, future):
+        if not future.done():
+            future.set_result(None)
+
+    def wake(self, future):
+        """Resolve a future of the event loop from any thread."""
+        self.loop.call_soon_threadsafe(self.resolve, future)
+
 #------------------------------------- função que responde ao endpoint /stats -----------------------------------------
     def stats(self):
-        self.logger.info("Handling stats request")
-        stat_event = threading.Event()
-        stats_ans = {}
-        self.request_id += 1
-        reqId = self.request_id 
-        self.stats_events[(reqId,self.addr)] = (stat_event, stats_ans)
-        total_solved = 0
-        total_val = 0
-        list_send = []
-        list_send += self.connections
-        list_send.append(self.addr)
-
+        """ Answer /stats from the cluster counters gossiped on the alive messages, without touching the network. """
+        self.ready.wait()
+        self.cluster.update(self.validations, self.num_solved)
         response = {"all": {"solved": 0, "validations": 0}, "nodes": []}
-        if self.validations != 0:
-            self.nodes_stats[f"{self.addr[0]}:{self.addr[1]}"] = [self.validations, self.num_solved]
-
-        for con in self.connections:
-            self.send(con, CDProto.stats_req(self.addr, list_send, (reqId,self.addr)).pickle())
-        
-        self.logger.info("Waiting for stats response")
-        stat_event.wait()
-        self.logger.info("Received stats response")
-
-        for addr in stats_ans:
-            msg = stats_ans[addr]
-            if msg["validation"] != 0:
-                self.nodes_stats[f"{addr[0]}:{addr[1]}"] = [msg["validation"], msg["solved"]]
-
-        for con in self.connections:
-            self.send(con, CDProto.stats_hist(self.nodes_stats, list_send).pickle())
-        
-        for addr in self.nodes_stats:
-            response["nodes"].append({"address": addr, "validations": self.nodes_stats[addr][0]})
-            total_solved += self.nodes_stats[addr][1]
-            total_val += self.nodes_stats[addr][0]
-        
-        del self.stats_events[(reqId,self.addr)]
-        response["all"]["solved"] = total_solved
-        response["all"]["validations"] = total_val
-
-        self.logger.info(f"Stats response: {response}")
+        for node, (_, validations, solved) in self.cluster.view().items():
+            if validations != 0:
+                response["nodes"].append({"address": node, "validations": validations})
+            response["all"]["solved"] += solved
+            response["all"]["validations"] += validations
+        response["cache"] = self.cache.stats()
+        response["outbound"] = self.outbox.stats()
         return response
 
     #------------------------------------- função que responde ao endpoint /network -----------------------------------------
     def network(self):
+        return self.call(self.network_request())
+
+    async def network_request(self):
         if not self.connections:
             self.logger.warning("No connections available")
             return {"error": "No connections available"}
 
-        net_event = threading.Event()
+        net_event = self.loop.create_future()
         net_ans = {}
-        self.request_id += 1
-        reqId = self.request_id 
+        reqId = self.new_request_id()
         self.network_events[(reqId,self.addr)] = (net_event, net_ans)
-        list_send = []
-        list_send += self.connections
-        list_send.append(self.addr)
 
-        for con in self.connections:
-            self.send(con, CDProto.net_req(self.addr, list_send, (reqId,self.addr)).pickle())
+        self.broadcast(CDProto.net_req(self.addr, (reqId,self.addr)).pickle())
         
         # Adição de log e tempo limite
         self.logger.info(f"Waiting for network response for request ID {(reqId,self.addr)}")
-        net_event.wait(timeout=5)  # Adding a timeout to avoid indefinite wait
-        
-        if net_event.is_set():
+        try:
+            await asyncio.wait_for(net_event, NETWORK_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+        if net_event.done():
             self.logger.info("Received network response")
             response = self.do_network_dict()
             for addr in net_ans:
@@ -206,250 +294,447 @@ class P2PServer(threading.Thread):
     
     #----------------------- resolução do sudoku e funções auxiliares -------------------------------------
     def solve_api(self, sudoku: dict):
+        return self.solve_future(sudoku).result()
+
+    def solve_future(self, sudoku: dict):
+        """Start solving from another thread. The returned future can be cancelled, which
+        stops the search in the whole network."""
+        self.ready.wait()
+        return asyncio.run_coroutine_threadsafe(self.solve_request(sudoku), self.loop)
+
+    async def solve_request(self, sudoku: dict):
+        """Solve sudoku["sudoku"], giving up after sudoku["timeout_ms"], or the node's
+        solve_timeout_ms if it is not given.
+
+        Returns a dict with the solution in "sudoku" ([] if there is none or the deadline
+        expired), "time", "validations", "timed_out" and the "preflight" report. Only the
+        puzzles that pass the preflight checks and need a search go to the network.
+        """
         start=time.time()
-        stop_event = threading.Event()
-        solve_ans = {}
-        ans = []
-        self.request_id += 1
-        reqId = self.request_id
-        self.solve_api_events[(reqId,self.addr)] = [stop_event,solve_ans]
-        list_send = [self.addr] + self.connections
+        timeout_ms = sudoku.get("timeout_ms") or self.solve_timeout_ms
+        result = {"sudoku": [], "validations": 0, "timed_out": False}
+        result["preflight"] = check = preflight(sudoku["sudoku"])
+        if check["status"] != "search":
+            self.logger.info(f"[SUDOKU]: Preflight {check['status']}")
+            result["sudoku"] = check.pop("solution", [])
+            result["time"] = time.time()-start
+            return result
+
+        # o trabalho de CPU corre fora do event loop
+        form = await self.loop.run_in_executor(None, canonical_form, sudoku["sudoku"])
+        cached = await self.cached_solution(sudoku["sudoku"], form)
+        if cached is not None:
+            self.logger.info("[SUDOKU]: Solution found in cache")
+            result.update(sudoku=cached, time=time.time()-start)
+            return result
 
-        for con in self.connections:
-            self.send(con,CDProto.solve_req(sudoku["sudoku"],self.addr,list_send,(reqId,self.addr)).pickle())
+        stop_event = threading.Event()
+        done = self.loop.create_future()
+        reqId = self.new_request_id()
+        key = (reqId,self.addr)
+        self.solve_api_events[key] = [done,[],0]
+        self.solve_events[key] = stop_event
+        self.credits[key] = Fraction(0)
 
-        #Encontra todas as celulas que precisam de numero.
-        puzzle = Sudoku(sudoku["sudoku"])
-        coords = puzzle.empty_coords()
-        numbers = puzzle.possible_values_by_row()
-        self.logger.debug(f"[Empty cells]: {coords}")
-        self.logger.debug(f"[Puzzle]: {puzzle.grid}")
-        self.logger.debug(f"[VALUES]: {numbers}")
+        try:
+            # o coordenador divide o sudoku em partições: uma para cada vizinho e as restantes
+            # ficam na sua fila, de onde os nós sem trabalho as vão roubando
+            tasks = await self.loop.run_in_executor(
+                None, split_task, new_task(key, self.addr, sudoku["sudoku"], solver=sudoku.get("solver")),
+                self.num_nodes * PARTITIONS_PER_NODE)
+            self.logger.debug(f"[Partitions]: {len(tasks)}")
+            if not tasks:
+                self.resolve(done)
+
+            self.broadcast(CDProto.solve_req(sudoku["sudoku"],self.addr,key,timeout_ms=timeout_ms).pickle())
+            # cada vizinho recebe partições na proporção das suas validações por segundo
+            shares = self.cost.shares([None] + self.connections, len(tasks))
+            for con in self.connections:
+                for _ in range(shares[con]):
+                    self.send(con,CDProto.solve_req(tasks.pop(),self.addr,key,True,timeout_ms).pickle())
+            self.work.push(tasks)
+
+            await asyncio.wait({done}, timeout=timeout_ms / 1000)
+        finally:
+            # também quando o pedido é cancelado, p.ex. porque o cliente HTTP desligou
+            self.broadcast(CDProto.solve_stop(key).pickle())
+            self.finish_request(key)
+            # os créditos saem primeiro, para o add_credit não ver um pedido sem evento
+            with self.credits_lock:
+                del self.credits[key]
+            _, ans, validations = self.solve_api_events.pop(key)
+
+        timed_out = not done.done()
+        if timed_out:
+            self.logger.info(f"[SUDOKU]: Request {key} timed out")
+        if ans:
+            self.store_solution(sudoku["sudoku"], ans, form)
 
-        print("Solving the Sudoku puzzle...", puzzle.grid)
-        
-        while not self.solve_api_events[(reqId,self.addr)][0].is_set():
-            self.logger.debug(f"[STOP]: {self.solve_api_events[(reqId,self.addr)][0].is_set()}")
-            for coord in coords:
-                nums = numbers[coord[0]]
-                
-                puzzle.grid[coord[0]][coord[1]] = random.choice(nums)
-            self.validations += 1
-            if puzzle.check() and not self.solve_api_events[(reqId,self.addr)][0].is_set():
-                self.logger.info("[SUDOKU]: Finished")
-                ans = puzzle.grid
-                self.solve_api_events[(reqId,self.addr)][0].set()
-        self.logger.debug(f"sai do loop")
-        if ans == []:
-            ans = self.solve_api_events[(reqId,self.addr)][1]
-        
-        for con in self.connections:
-            self.send(con,CDProto.solve_stop(list_send,(reqId,self.addr)).pickle())
-        
-        
         end = time.time()
-        duration = end-start
-        self.logger.debug(f"[ANS2]: {self.solve_api_events[(reqId,self.addr)][1]}")
-        self.logger.debug(f"[ANS3]: {ans}")
-        del self.solve_api_events[(reqId,self.addr)]
-        return ans,duration
+        self.logger.debug(f"[ANS]: {ans}")
+        result.update(sudoku=ans, time=end-start, validations=validations, timed_out=timed_out)
+        return result
     
+    def cache_owner(self, key):
+        """Node that caches the solutions with puzzle hash 'key' (consistent hashing).
+
+        The ring is built from the gossiped membership, not from the neighbours, so that
+        every node agrees on the owner of a key once the membership has converged.
+        """
+        nodes = sorted(self.members.view()) if self.members is not None else [self.addr]
+        if self.ring is None or self.ring.nodes != nodes:
+            self.ring = HashRing(nodes)
+        return self.ring.owner(key)
+
+    async def cached_solution(self, grid, form):
+        """Solution of 'grid' from the local cache or else from the cache of the node
+        that owns its puzzle hash, waiting at most CACHE_TIMEOUT for the answer.
+
+        The entries may come from other nodes, so a solution that does not solve 'grid'
+        counts as a miss.
+        """
+        solution = self.cache.get(grid, form, lambda solution: is_solution(solution, grid))
+        if solution is not None or form is None:
+            return solution
+        owner = self.cache_owner(form[0])
+        if owner == self.addr:
+            return None
+
+        key = (self.new_request_id(),self.addr)
+        self.cache_events[key] = [self.loop.create_future(), None]
+        self.send(owner,CDProto.cache_req(form[0],key).pickle())
+        try:
+            await asyncio.wait_for(self.cache_events[key][0], CACHE_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        value = self.cache_events.pop(key)[1]
+        if value is None:
+            return None
+        solution = decode_solution(value, form[1])
+        if solution is None or not is_solution(solution, grid):
+            self.logger.warning(f"[CACHE]: Bad solution from {owner}")
+            return None
+        self.cache.remote_hits += 1
+        self.cache.put_key(form[0], value)
+        return solution
+
+    def store_solution(self, grid, solution, form):
+        """Cache a solution locally and in the node that owns its puzzle hash."""
+        if form is None:
+            return
+        self.cache.put(grid, solution, form)
+        owner = self.cache_owner(form[0])
+        if owner != self.addr:
+            self.send(owner,CDProto.cache_put(form[0],encode_solution(solution, form[1])).pickle())
+
     def num_solve_counter(self):
         self.num_solved += 1
 
-    def solve(self,sudoku,addr,req_id):
-        stop_event = threading.Event()
-        self.solve_events[req_id] = stop_event
-        
-        puzzle = Sudoku(sudoku)
-        coords = puzzle.empty_coords()
-        numbers = puzzle.possible_values_by_row()
-        self.logger.debug(f"[Empty cells]: {coords}")
-        self.logger.debug(f"[Puzzle]: {puzzle.grid}")
-        self.logger.debug(f"[VALUES]: {numbers}")
-
-        print("Solving the Sudoku puzzle...", puzzle.grid)
-        
-        while not self.solve_events[req_id].is_set():
-            self.logger.debug(f"[STOP]: {self.solve_events[req_id].is_set()}")
-            for coord in coords:
-                nums = numbers[coord[0]]
-                
-                puzzle.grid[coord[0]][coord[1]] = random.choice(nums)
-            self.validations += 1
-            if puzzle.check() and not self.solve_events[req_id].is_set():
-                self.logger.info("[SUDOKU]: Finished")
-                self.solve_events[req_id].set()
-                self.logger.debug(f"[STOP]: {self.solve_events[req_id].is_set()}")
-                self.send(addr,CDProto.solve_ans(puzzle.grid,req_id).pickle())
-        self.logger.debug(f"sai do loop")
-        del self.solve_events[req_id]
-        return
+    def finish_request(self, req_id):
+        """Stop the search of a request and drop its pending sub-problems."""
+        stop_event = self.solve_events.pop(req_id, None)
+        if stop_event is not None:
+            stop_event.set()
+        self.finished.append(req_id)
+        self.work.drop(req_id)
+
+    def accept_tasks(self, tasks):
+        """Queue sub-problems received from other nodes, ignoring finished requests."""
+        tasks = [t for t in tasks if t["req_id"] not in self.finished]
+        for task in tasks:
+            self.solve_events.setdefault(task["req_id"], threading.Event())
+        self.work.push(tasks)
+
+    def add_credit(self, req_id, weight, validations=0):
+        """Count the weight of a sub-problem searched without solution. When all the
+        weight of a request is back at its coordinator the sudoku has no solution."""
+        with self.credits_lock:
+            event = self.solve_api_events.get(req_id)
+            if req_id not in self.credits or event is None:
+                return
+            event[2] += validations
+            self.credits[req_id] += weight
+            if self.credits[req_id] >= 1:
+                self.logger.info(f"[SUDOKU]: No solution for request {req_id}")
+                self.wake(event[0])
+
+    def solve_partition(self, sudoku, stop_event, solver=None):
+        """Search a sub-problem with the engine of the request, or else with the one of the node."""
+        solver = solver or self.solver
+        self.logger.debug(f"[Puzzle]: {sudoku}, [Solver]: {solver}")
+        start = time.perf_counter()
+        if self.pool is not None:
+            solution, validations = self.pool.solve(sudoku, stop_event, solver)
+        else:
+            solution, validations = get_solver(solver, self.handicap / 1000).solve(sudoku, stop_event)
+        self.cost.measure(validations, time.perf_counter() - start)
+        self.validations += validations
+        return solution, validations
+
+    def solve(self, task):
+        stop_event = self.solve_events.get(task["req_id"])
+        if stop_event is None or stop_event.is_set():
+            return
+
+        # mantém trabalho na fila para os outros nós poderem roubar
+        if len(self.work) < LOW_WATER:
+            tasks = split_task(task, SPLIT_FACTOR)
+            if len(tasks) != 1:
+                if tasks:
+                    self.work.push(tasks)
+                else:
+                    self.task_done(task)
+                return
+
+        solution, validations = self.solve_partition(task["sudoku"], stop_event, task.get("solver"))
+        if stop_event.is_set():
+            return
+        if solution is not None:
+            self.logger.info("[SUDOKU]: Finished")
+            stop_event.set()
+            if task["address"] == self.addr:
+                self.found_solution(task["req_id"], solution, validations)
+            else:
+                self.send(task["address"],CDProto.solve_ans(solution,task["req_id"],validations).pickle())
+        else:
+            self.task_done(task, validations)
+
+    def task_done(self, task, validations=0):
+        if task["address"] == self.addr:
+            self.add_credit(task["req_id"], task["weight"], validations)
+        else:
+            self.send(task["address"],CDProto.work_done(task["req_id"],task["weight"],validations).pickle())
+
+    def found_solution(self, req_id, solution, validations):
+        """Store the solution of a request coordinated by this node and wake up solve_api."""
+        event = self.solve_api_events.get(req_id)
+        if event is not None:
+            event[1] = solution
+            event[2] += validations
+            self.wake(event[0])
+
+    def worker(self):
+        """Solve the queued sub-problems, stealing work from a random neighbour when
+        the queue is empty and some request is still being solved."""
+        while True:
+            task = self.work.pop()
+            if task is not None:
+                try:
+                    self.solve(task)
+                except Exception as e:
+                    # um sub-problema com erro (p.ex. um motor desconhecido) não pode parar o worker
+                    self.logger.error(f"[TASK]: {task['req_id']} failed, Error: {e!r}")
+                continue
+            busy = any(not event.is_set() for event in list(self.solve_events.values()))
+            if busy and self.connections:
+                self.send(random.choice(self.connections),CDProto.steal_req(self.cost.rate()).pickle())
+            self.work.wait(STEAL_INTERVAL)
       
     #----------------------- função run  -------------------------------------
-    def keepAlive(self):
-        for con in self.connections:
-            self.send(con,CDProto.alive().pickle())
-        alive_method = threading.Timer(interval=5,function=self.keepAlive)
-        alive_method.start()
-    
+    async def keep_alive(self):
+        """ Timer task: tell the neighbours this node is alive every ALIVE_INTERVAL seconds and look for failed nodes. """
+        while True:
+            now = time.monotonic()
+            self.members.beat(now)
+            self.cluster.update(self.validations, self.num_solved)
+            counters = self.cluster.view()
+            members = self.members.view()
+            for con in self.connections:
+                self.send(con,CDProto.alive(self.cost.local, counters, members).pickle())
+            self.detect_failures(now)
+            await asyncio.sleep(ALIVE_INTERVAL)
+
+    def detect_failures(self, now):
+        """ Probe the silent neighbours, directly and through others, and evict the dead ones. """
+        probe, dead = self.detector.check(list(self.connections), now)
+        for suspect in probe:
+            self.send(suspect,CDProto.ping().pickle())
+            others = [con for con in self.connections if con != suspect]
+            for con in random.sample(others, min(PROBE_FANOUT, len(others))):
+                self.send(con,CDProto.ping_req(suspect).pickle())
+        for node in dead:
+            self.logger.warning(f"Node down: {node}")
+            self.handle_disconnection(node)
+        for node in self.members.expire(now):
+            self.logger.warning(f"Node left the network: {node}")
+            if node in self.connections:
+                self.handle_disconnection(node)
+
     def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
         self.socket.bind(self.addr)
         port = self.addr[1]
-        self.addr = (socket.gethostbyname_ex(socket.gethostname())[2][1], port)
+        ips = socket.gethostbyname_ex(socket.gethostname())[2]
+        self.addr = (ips[1] if len(ips) > 1 else ips[0], port)
         self.logger.info(f"[Node Address]: {self.addr}")
+        self.cluster = ClusterStats(f"{self.addr[0]}:{self.addr[1]}")
+        self.members = Membership(self.addr, time.monotonic(), MEMBER_TIMEOUT)
+        self.loop = asyncio.get_running_loop()
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: NodeProtocol(self), sock=self.socket)
 
         if self.join_addr is not None:
-            self.send(self.join_addr, CDProto.join_req().pickle())
-
-        self.keepAlive()
+            self.send(self.join_addr, CDProto.join_req(self.codecs).pickle())
 
+        threading.Thread(target=self.worker, daemon=True).start()
+        self.ready.set()
+        self.flush()
+        await self.keep_alive()
 
-        while True:
-            if self.num_nodes <= len(self.connections):
-                self.num_nodes = len(self.connections) + 1
-                list_send = []
-                list_send += self.connections
-                list_send.append(self.addr)
-                for con in self.connections:
-                    print("list_send: ",list_send)
-                    self.send(con, CDProto.NumUpdate(self.num_nodes, list_send).pickle())
-
-            msg, addr = self.recv()
-            if msg is not None:
-                self.logger.info(f"[FROM]: {addr}, [RECEIVED]: {str(msg)}")
-
+    def handle(self, msg, addr):
+        """ Dispatch a message received from addr, in the event loop. """
     #-------------------- handles the JoinRequest message ---------------------------(DONE) 
-                if msg["command"] == "join_req":
-                    self.num_nodes += 1
-                    for con in self.connections:
-                        self.send(con,CDProto.NumUpdate(self.num_nodes,self.connections).pickle())
-                    self.connections.append(addr)
-                    self.send(addr,CDProto.join_ans("ACK",self.num_nodes).pickle())
+        if msg["command"] == "join_req":
+            self.members.add(addr, time.monotonic())
+            self.broadcast(CDProto.NumUpdate(self.num_nodes).pickle())
+            self.connections.append(addr)
+            wire = next((c for c in self.codecs if c in msg.get("codecs", ())), codec.PICKLE)
+            self.send(addr,CDProto.join_ans("ACK",self.num_nodes,wire).pickle())
+            self.peer_codecs[addr] = wire
 
     #-------------------- handles the JoinAnswer message ---------------------------(DONE) 
-                elif msg["command"] == "join_ans":
-                    if msg["answer"] == "ACK":
-                        self.connections.append(addr)
-                        self.num_nodes = msg["NodesNum"]
-                        if self.num_nodes > 2:
-                            self.send(addr,CDProto.node_req().pickle())
+        elif msg["command"] == "join_ans":
+            if msg["answer"] == "ACK":
+                self.connections.append(addr)
+                self.members.add(addr, time.monotonic())
+                self.peer_codecs[addr] = msg.get("codec", codec.PICKLE)
+                if msg["NodesNum"] > 2:
+                    self.send(addr,CDProto.node_req().pickle())
 
     #-------------------- handles the NumNodesUpdate message ---------------------------(DONE)     
-                elif msg["command"] == "update":
-                        self.num_nodes = msg["NodesNum"]
-                        if self.num_nodes > 2 and len(self.connections) == 1:
-                            self.send(addr,CDProto.node_req().pickle())
-                        else:
-                            lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                            if lst_send != []:
-                                for con in lst_send:
-                                    self.send(con,CDProto.NumUpdate(self.num_nodes,lst_addr).pickle())
+        elif msg["command"] == "update":
+                if msg["NodesNum"] > 2 and len(self.connections) == 1:
+                    self.send(addr,CDProto.node_req().pickle())
+                else:
+                    self.forward(msg, addr)
 
     #-------------------- handles the NodeShutdown message ---------------------------(DONE) 
-                elif msg["command"] == "node_down":
-                    if msg["address"] in self.connections:
-                        self.connections.remove(msg["address"])
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.node_down(msg["address"],lst_addr).pickle())
+        elif msg["command"] == "node_down":
+            if msg["address"] != self.addr:
+                self.remove_node(msg["address"])
+            self.forward(msg, addr)
 
     #-------------------- handles the NodeRequest message ---------------------------(DONE)         
-                elif msg["command"] == "node_req":
-                    possible_nodes = []
-                    for con in self.connections:
-                        if con != addr:
-                            possible_nodes.append(con)
-                    if possible_nodes != []:
-                        self.send(addr,CDProto.node_ans(possible_nodes[0]).pickle())
-                        #self.send(possible_nodes[0],CDProto.node_ans(addr).pickle())
-                    else:
-                        self.send(addr,CDProto.node_ans(None).pickle())
+        elif msg["command"] == "node_req":
+            possible_nodes = []
+            for con in self.connections:
+                if con != addr:
+                    possible_nodes.append(con)
+            if possible_nodes != []:
+                self.send(addr,CDProto.node_ans(possible_nodes[0]).pickle())
+                #self.send(possible_nodes[0],CDProto.node_ans(addr).pickle())
+            else:
+                self.send(addr,CDProto.node_ans(None).pickle())
 
     #-------------------- handles the NodeAnswer message ---------------------------(DONE) 
-                elif msg["command"] == "node_ans":
-                    if msg["address"] != None:
-                        if msg["address"] not in self.connections:
-                            self.connections.append(msg["address"])
-                    else:
-                        self.logger.info("There are no more nodes to connect to")#se que mudar esta mensagem
-
-    #-------------------- handles the StatsRequest message ---------------------------(DONE) 
-                elif msg["command"] == "stats_req":
-                    print("stats_req: ",msg)
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.stats_req(msg["address"],lst_addr,msg["req_id"]).pickle())
-                    self.send(msg["address"],CDProto.stats_ans(self.validations,self.num_solved,msg["req_id"]).pickle())
-
-    #-------------------- handles the StatsAnswer message ---------------------------(DONE) 
-                elif msg["command"] == "stats_ans":
-                    key = msg["req_id"]
-                    self.stats_events[key][1][addr] = msg
-                    if len(self.stats_events[key][1]) == self.num_nodes-1:
-                        self.stats_events[key][0].set()
-
-    #-------------------- handles the StatsHistory message ---------------------------(DONE) 
-                elif msg["command"] == "stats_hist":
-                    self.nodes_stats = msg["history"]
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.stats_hist(self.nodes_stats,lst_addr).pickle())
+        elif msg["command"] == "node_ans":
+            if msg["address"] != None:
+                if msg["address"] not in self.connections:
+                    self.connections.append(msg["address"])
+            else:
+                self.logger.info("There are no more nodes to connect to")#se que mudar esta mensagem
 
     #-------------------- handles the NetworkRequest message ---------------------------(DONE) 
-                elif msg["command"] == "network_req":
-                    self.logger.info("Processing network request")
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.net_req(msg["address"],lst_addr,msg["req_id"]).pickle())
-                    self.send(msg["address"],CDProto.net_ans(self.do_network_dict(),msg["req_id"]).pickle())
+        elif msg["command"] == "network_req":
+            self.logger.info("Processing network request")
+            self.forward(msg, addr)
+            self.send(msg["address"],CDProto.net_ans(self.do_network_dict(),msg["req_id"]).pickle())
 
     #-------------------- handles the NetworkAnswer message ---------------------------(DONE) 
-                elif msg["command"] == "network_ans":
-                    key = msg["req_id"]
-                    
-                    if key in self.network_events:
-                        self.network_events[key][1][addr] = msg
-                        if len(self.network_events[key][1]) == self.num_nodes-1:
-                            self.network_events[key][0].set()
-                    else:
-                        self.logger.warning(f"Received network answer for unknown request ID {key}")
+        elif msg["command"] == "network_ans":
+            key = msg["req_id"]
+            
+            if key in self.network_events:
+                self.network_events[key][1][addr] = msg
+                if len(self.network_events[key][1]) == self.num_nodes-1:
+                    self.resolve(self.network_events[key][0])
+            else:
+                self.logger.warning(f"Received network answer for unknown request ID {key}")
 
     #-------------------- handles the SolveRequest message ---------------------------
-                elif msg["command"] == "solve_req":
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.solve_req(msg["sudoku"],addr,lst_addr,msg["req_id"]).pickle())
-                    solve_thread = threading.Thread(target=self.solve, args=(msg["sudoku"], addr, msg["req_id"]))
-                    solve_thread.start()
+        elif msg["command"] == "solve_req":
+            # o pedido acaba no prazo mesmo que a mensagem "solved" se perca
+            if msg.get("timeout_ms"):
+                self.loop.call_later(msg["timeout_ms"] / 1000, self.finish_request, msg["req_id"])
+            if msg["is_sub_request"]:
+                self.accept_tasks([msg["sudoku"]])
+            else:
+                self.forward(msg, addr)
+                if msg["req_id"] not in self.finished:
+                    self.solve_events.setdefault(msg["req_id"], threading.Event())
+                    self.work.event.set()
+
+    #-------------------- handles the WorkDone message ---------------------------
+        elif msg["command"] == "work_done":
+            self.add_credit(msg["req_id"], msg["weight"], msg["validations"])
+
+    #-------------------- handles the StealRequest message ---------------------------
+        elif msg["command"] == "steal_req":
+            limit = self.cost.steal_limit(len(self.work), msg.get("rate") or self.cost.rate(addr))
+            self.send(addr,CDProto.steal_ans(self.work.steal(limit)).pickle())
+
+    #-------------------- handles the StealAnswer message ---------------------------
+        elif msg["command"] == "steal_ans":
+            self.accept_tasks(msg["tasks"])
+
     #-------------------- handles the SolveAnswer message ---------------------------
-                elif msg["command"] == "solve_ans":
-                    key = msg["req_id"]
-                    if key in self.solve_api_events:
-                        self.solve_api_events[key][0].set()
-                        self.solve_api_events[key][1] = msg["sudoku"]
-                        self.logger.debug(f"[stop]: {self.solve_api_events[key][0].is_set()}")
-                        self.logger.debug(f"[ANS1]: {self.solve_api_events[key][1]}")
+        elif msg["command"] == "solve_ans":
+            key = msg["req_id"]
+            self.found_solution(key, msg["sudoku"], msg["validations"])
 
     #-------------------- handles the SolveStop message ---------------------------
-                elif msg["command"] == "solved":
-                    
-                    lst_addr, lst_send = self.prop_messages(msg["NodeSent"])
-                    if lst_send != []:
-                        for con in lst_send:
-                            self.send(con,CDProto.solve_stop(lst_addr,msg["req_id"]).pickle())
-                    if msg["req_id"] in self.solve_events:
-                        self.solve_events[msg["req_id"]].set()
+        elif msg["command"] == "solved":
+            self.forward(msg, addr)
+            self.finish_request(msg["req_id"])
+
+    #-------------------- handles the CacheRequest message ---------------------------
+        elif msg["command"] == "cache_req":
+            self.send(addr,CDProto.cache_ans(msg["key"],self.cache.get_key(msg["key"]),msg["req_id"]).pickle())
+
+    #-------------------- handles the CacheAnswer message ---------------------------
+        elif msg["command"] == "cache_ans":
+            key = msg["req_id"]
+            if key in self.cache_events:
+                self.cache_events[key][1] = msg["solution"]
+                self.resolve(self.cache_events[key][0])
+
+    #-------------------- handles the CacheStore message ---------------------------
+        elif msg["command"] == "cache_put":
+            # só as pistas do puzzle ficam por verificar, quando a entrada for usada
+            solution = canonical_solution(msg["solution"])
+            if isinstance(msg["key"], bytes) and solution is not None and is_solution(solution):
+                self.cache.put_key(msg["key"], msg["solution"])
+            else:
+                self.logger.warning(f"[CACHE]: Bad solution from {addr}")
 
     #-------------------- handles the Alive message ---------------------------
-                elif msg["command"] == "alive":
-                    if addr not in self.connections:
-                        self.connections.append(addr)
+        elif msg["command"] == "alive":
+            if addr not in self.connections:
+                self.connections.append(addr)
+            if msg.get("rate"):
+                self.cost.update(addr, msg["rate"])
+            if msg.get("counters"):
+                self.cluster.merge(msg["counters"])
+            self.members.add(addr, time.monotonic())
+            if msg.get("members"):
+                self.members.merge(msg["members"], time.monotonic())
+
+    #-------------------- handles the Ping message ---------------------------
+        elif msg["command"] == "ping":
+            self.send(addr,CDProto.ack(self.addr, msg.get("requester")).pickle())
+
+    #-------------------- handles the PingRequest message ---------------------------
+        elif msg["command"] == "ping_req":
+            self.send(msg["address"],CDProto.ping(addr).pickle())
+
+    #-------------------- handles the Ack message ---------------------------
+        elif msg["command"] == "ack":
+            # resposta a um ping_req, passa ao nó que o pediu
+            if msg.get("requester") is not None and msg["requester"] != self.addr:
+                self.send(msg["requester"],CDProto.ack(msg["address"]).pickle())
+            elif msg["address"] in self.connections:
+                self.detector.heard(msg["address"], time.monotonic())
 
     #         if self.num_nodes != 1:
     #             for i, con in enumerate(self.connections):
@@ -7,32 +7,33 @@ class Message:
 
     
 class JoinRequest(Message):
-    """Message to request connection with node."""
-    def __init__(self, com):
+    """Message to request connection with node, offering the wire codecs it can read."""
+    def __init__(self, com, codecs:list):
         super().__init__(com)
+        self.codecs = codecs
 
     def pickle(self):
-        return {"command": "join_req"}
+        return {"command": "join_req", "codecs": self.codecs}
     
 class JoinAnswer(Message):
-    """Message to confirm or not the join request."""
-    def __init__(self, com, answer:str,num_nodes):
+    """Message to confirm or not the join request, with the wire codec chosen for the link."""
+    def __init__(self, com, answer:str,num_nodes,codec="pickle"):
         super().__init__(com)
         self.answer = answer
         self.num_nodes = num_nodes
+        self.codec = codec
 
     def pickle(self):
-        return {"command": "join_ans", "answer": self.answer, "NodesNum": self.num_nodes}
+        return {"command": "join_ans", "answer": self.answer, "NodesNum": self.num_nodes, "codec": self.codec}
 
 class NodeShutdown(Message):
     """Message to inform the network that this node is not working anymore."""
-    def __init__(self, com,addr,lst_addr):
+    def __init__(self, com,addr):
         super().__init__(com)
         self.addr = addr
-        self.lst_addr = lst_addr
     
     def pickle(self):
-        return {"command": "node_down","address": self.addr, "NodeSent": self.lst_addr}
+        return {"command": "node_down","address": self.addr}
 
 class NodeRequest(Message):
     """Message to request connection with node."""
@@ -53,56 +54,22 @@ class NodeAnswer(Message):
     
 class NumNodesUpdate(Message):
     """Message to confirm or not the join request."""
-    def __init__(self, com, num_nodes, lst_addr):
+    def __init__(self, com, num_nodes):
         super().__init__(com)
-        self.lst_addr = lst_addr
         self.num_nodes = num_nodes
 
     def pickle(self):
-        return {"command": "update", "NodesNum": self.num_nodes, "NodeSent": self.lst_addr}
-
-class StatsRequest(Message):
-    """Message to request number o validations."""
-    def __init__(self, com, req_addr,lst_addr,req_id):
-        super().__init__(com)
-        self.req_addr = req_addr
-        self.lst_addr = lst_addr
-        self.req_id = req_id
-
-    def pickle(self):
-        return {"command": "stats_req","address": self.req_addr, "NodeSent": self.lst_addr, "req_id": self.req_id}
-    
-class StatsAnswer(Message):
-    """Message to send the number of validations."""
-    def __init__(self, com, validation:int,solved:int,req_id):
-        super().__init__(com)
-        self.val = validation
-        self.solved = solved
-        self.req_id = req_id
-
-    def pickle(self):
-        return {"command": "stats_ans", "validation": self.val, "solved": self.solved, "req_id": self.req_id}
+        return {"command": "update", "NodesNum": self.num_nodes}
 
-class StatsHistory(Message):
-    """Message to send the number of validations."""
-    def __init__(self, com, nodes_stats,lst_addr):
-        super().__init__(com)
-        self.nodes_stats = nodes_stats
-        self.lst_addr = lst_addr
-
-    def pickle(self):
-        return {"command": "stats_hist", "history": self.nodes_stats, "NodeSent": self.lst_addr}
-    
 class NetworkRequest(Message):
     """Message to request network connections."""
-    def __init__(self, com, req_addr,lst_addr,req_id):
+    def __init__(self, com, req_addr,req_id):
         super().__init__(com)
         self.req_addr = req_addr
-        self.lst_addr = lst_addr
         self.req_id = req_id
 
     def pickle(self):
-        return {"command": "network_req","address": self.req_addr, "NodeSent": self.lst_addr, "req_id": self.req_id}
+        return {"command": "network_req","address": self.req_addr, "req_id": self.req_id}
     
 class NetworkAnswer(Message):
     """Message to send the network connections."""
@@ -115,45 +82,139 @@ class NetworkAnswer(Message):
         return {"command": "network_ans", "network": self.network, "req_id": self.req_id}
 
 class SolveRequest(Message):
-    """Message to request the solving od sudoku."""
-    def __init__(self, com, sudoku:list,req_addr,lst_addr,req_id, is_sub_request=False):
+    """Message to request the solving od sudoku.
+    A sub request carries a single sub-problem (see scheduler.new_task) instead of the grid.
+    With timeout_ms the nodes give up on the request after that time."""
+    def __init__(self, com, sudoku,req_addr,req_id, is_sub_request=False, timeout_ms=None):
         super().__init__(com)
         self.sudoku = sudoku
         self.req_addr = req_addr
-        self.lst_addr = lst_addr
         self.req_id = req_id
         self.is_sub_request = is_sub_request
+        self.timeout_ms = timeout_ms
+
+    def pickle(self):
+        return {"command": "solve_req", "sudoku": self.sudoku,"address": self.req_addr, "req_id": self.req_id, "is_sub_request": self.is_sub_request, "timeout_ms": self.timeout_ms}
+
+class WorkDone(Message):
+    """Message to give back to the coordinator the weight of a sub-problem searched without solution."""
+    def __init__(self, com, req_id, weight, validations=0):
+        super().__init__(com)
+        self.req_id = req_id
+        self.weight = weight
+        self.validations = validations
+
+    def pickle(self):
+        return {"command": "work_done", "req_id": self.req_id, "weight": self.weight, "validations": self.validations}
+
+class StealRequest(Message):
+    """Message to ask an idle node's neighbour for its pending sub-problems, with the
+    validations/s of the thief so that the neighbour gives it a fair share of them."""
+    def __init__(self, com, rate=None):
+        super().__init__(com)
+        self.rate = rate
 
     def pickle(self):
-        return {"command": "solve_req", "sudoku": self.sudoku,"address": self.req_addr, "NodeSent": self.lst_addr, "req_id": self.req_id, "is_sub_request": self.is_sub_request}
+        return {"command": "steal_req", "rate": self.rate}
+
+class StealAnswer(Message):
+    """Message to send the stolen sub-problems."""
+    def __init__(self, com, tasks:list):
+        super().__init__(com)
+        self.tasks = tasks
+
+    def pickle(self):
+        return {"command": "steal_ans", "tasks": self.tasks}
     
 class SolveAnswer(Message):
     """Message to send solution of sudoku."""
-    def __init__(self, com, sudoku:list,req_id):
+    def __init__(self, com, sudoku:list,req_id,validations=0):
         super().__init__(com)
         self.sudoku = sudoku
         self.req_id = req_id
+        self.validations = validations
 
     def pickle(self):
-        return {"command": "solve_ans", "sudoku": self.sudoku, "req_id": self.req_id}
+        return {"command": "solve_ans", "sudoku": self.sudoku, "req_id": self.req_id, "validations": self.validations}
     
 class SolveStop(Message):
     """Message to warn that the sudoku puzzle has been solved."""
-    def __init__(self, com,lst_addr,req_id):
+    def __init__(self, com,req_id):
+        super().__init__(com)
+        self.req_id = req_id
+
+    def pickle(self):
+        return {"command": "solved","req_id": self.req_id}
+
+class CacheRequest(Message):
+    """Message to look up a solution in the cache of the node that owns the puzzle hash."""
+    def __init__(self, com, key:bytes, req_id):
         super().__init__(com)
-        self.lst_addr = lst_addr
+        self.key = key
         self.req_id = req_id
 
     def pickle(self):
-        return {"command": "solved","NodeSent": self.lst_addr, "req_id": self.req_id}
+        return {"command": "cache_req", "key": self.key, "req_id": self.req_id}
+
+class CacheAnswer(Message):
+    """Message to send the cached (canonical) solution, None if it is not cached."""
+    def __init__(self, com, key:bytes, solution, req_id):
+        super().__init__(com)
+        self.key = key
+        self.solution = solution
+        self.req_id = req_id
+
+    def pickle(self):
+        return {"command": "cache_ans", "key": self.key, "solution": self.solution, "req_id": self.req_id}
+
+class CacheStore(Message):
+    """Message to store a (canonical) solution in the cache of the node that owns the puzzle hash."""
+    def __init__(self, com, key:bytes, solution):
+        super().__init__(com)
+        self.key = key
+        self.solution = solution
+
+    def pickle(self):
+        return {"command": "cache_put", "key": self.key, "solution": self.solution}
 
 class KeepAlive(Message):
-    """Message to warn that the sudoku puzzle has been solved."""
-    def __init__(self, com):
+    """Message to tell the neighbours the node is alive, with its validations/s and its view of the cluster counters and members."""
+    def __init__(self, com, rate=None, counters=None, members=None):
+        super().__init__(com)
+        self.rate = rate
+        self.counters = counters
+        self.members = members
+
+    def pickle(self):
+        return {"command": "alive", "rate": self.rate, "counters": self.counters, "members": self.members}
+
+class Ping(Message):
+    """Message to probe a suspect node, on behalf of 'requester' if it came from a ping request."""
+    def __init__(self, com, requester=None):
+        super().__init__(com)
+        self.requester = requester
+
+    def pickle(self):
+        return {"command": "ping", "requester": self.requester}
+
+class PingRequest(Message):
+    """Message to ask a neighbour to probe a suspect node for us."""
+    def __init__(self, com, addr):
         super().__init__(com)
+        self.addr = addr
+
+    def pickle(self):
+        return {"command": "ping_req", "address": self.addr}
+
+class Ack(Message):
+    """Message to answer a ping, telling that the node in 'address' is alive."""
+    def __init__(self, com, addr, requester=None):
+        super().__init__(com)
+        self.addr = addr
+        self.requester = requester
 
     def pickle(self):
-        return {"command": "alive"}
+        return {"command": "ack", "address": self.addr, "requester": self.requester}
 
 # class List(Message):
 #     """Message to warn that the sudoku puzzle has been solved."""
@@ -168,24 +229,30 @@ class CDProto:
     """Computação Distribuida Protocol."""
 
     @classmethod
-    def join_req(cls) -> JoinRequest:
+    def flood(cls,msg:dict,msg_id,ttl) -> dict:
+        """Adds the broadcast header to a message flooded through the network:
+        a (origin address, sequence number) id and the hops it may still travel."""
+        return {**msg, "msg_id": msg_id, "ttl": ttl}
+
+    @classmethod
+    def join_req(cls,codecs=("pickle",)) -> JoinRequest:
         """Creates a JoinRequest object."""
-        return JoinRequest("join_req")
+        return JoinRequest("join_req",list(codecs))
     
     @classmethod
-    def join_ans(cls,answer,num_nodes) -> JoinAnswer:
+    def join_ans(cls,answer,num_nodes,codec="pickle") -> JoinAnswer:
         """Creates a JoinAnswer object."""
-        return JoinAnswer("join_ans",answer,num_nodes)
+        return JoinAnswer("join_ans",answer,num_nodes,codec)
     
     @classmethod
-    def NumUpdate(cls,num_nodes,lst_addr) -> NumNodesUpdate:
+    def NumUpdate(cls,num_nodes) -> NumNodesUpdate:
         """Creates a NumNodesUpdate object."""
-        return NumNodesUpdate("update",num_nodes,lst_addr)
+        return NumNodesUpdate("update",num_nodes)
 
     @classmethod
-    def node_down(cls,addr,lst_addr) -> NodeShutdown:
+    def node_down(cls,addr) -> NodeShutdown:
         """Creates a NodeShutdown object."""
-        return NodeShutdown("node_down",addr,lst_addr)
+        return NodeShutdown("node_down",addr)
 
     @classmethod
     def node_req(cls) -> NodeRequest:
@@ -198,24 +265,9 @@ class CDProto:
         return NodeAnswer("node_ans",node_addr)  
     
     @classmethod
-    def stats_req(cls,req_addr,lst_addr,req_id) -> StatsRequest:
-        """Creates a StatsRequest object."""
-        return StatsRequest("stats_req",req_addr,lst_addr,req_id)
-    
-    @classmethod
-    def stats_ans(cls,validation,solved,req_id) -> StatsAnswer:
-        """Creates a StatsAnswer object."""
-        return StatsAnswer("stats_ans",validation,solved,req_id)
-    
-    @classmethod
-    def stats_hist(cls,nodes_stats,lst_addr) -> StatsHistory:
-        """Creates a StatsHistory object."""
-        return StatsHistory("stats_hist",nodes_stats,lst_addr)
-    
-    @classmethod
-    def net_req(cls,req_addr,lst_addr,req_id) -> NetworkRequest:
+    def net_req(cls,req_addr,req_id) -> NetworkRequest:
         """Creates a NetworkRequest object."""
-        return NetworkRequest("network_req",req_addr,lst_addr,req_id)
+        return NetworkRequest("network_req",req_addr,req_id)
     
     @classmethod
     def net_ans(cls,network,req_id) -> NetworkAnswer:
@@ -223,24 +275,69 @@ class CDProto:
         return NetworkAnswer("network_ans",network,req_id)
     
     @classmethod
-    def solve_req(cls,sudoku,addr,lst_addr,req_id, is_sub_request=False) -> SolveRequest:
+    def solve_req(cls,sudoku,addr,req_id, is_sub_request=False, timeout_ms=None) -> SolveRequest:
         """Creates a SolveRequest object."""
-        return SolveRequest("solve_req",sudoku,addr,lst_addr,req_id, is_sub_request)
+        return SolveRequest("solve_req",sudoku,addr,req_id, is_sub_request, timeout_ms)
+
+    @classmethod
+    def work_done(cls,req_id,weight,validations=0) -> WorkDone:
+        """Creates a WorkDone object."""
+        return WorkDone("work_done",req_id,weight,validations)
+
+    @classmethod
+    def steal_req(cls,rate=None) -> StealRequest:
+        """Creates a StealRequest object."""
+        return StealRequest("steal_req",rate)
+
+    @classmethod
+    def steal_ans(cls,tasks) -> StealAnswer:
+        """Creates a StealAnswer object."""
+        return StealAnswer("steal_ans",tasks)
     
     @classmethod
-    def solve_ans(cls,sudoku,req_id) -> SolveAnswer:
+    def solve_ans(cls,sudoku,req_id,validations=0) -> SolveAnswer:
         """Creates a SolveAnswer object."""
-        return SolveAnswer("solve_ans",sudoku,req_id)
+        return SolveAnswer("solve_ans",sudoku,req_id,validations)
     
     @classmethod
-    def solve_stop(cls,lst_addr,req_id) -> SolveStop:
+    def solve_stop(cls,req_id) -> SolveStop:
         """Creates a SolveStop object."""
-        return SolveStop("solved",lst_addr,req_id)
+        return SolveStop("solved",req_id)
     
     @classmethod
-    def alive(cls) -> KeepAlive:
+    def cache_req(cls,key,req_id) -> CacheRequest:
+        """Creates a CacheRequest object."""
+        return CacheRequest("cache_req",key,req_id)
+
+    @classmethod
+    def cache_ans(cls,key,solution,req_id) -> CacheAnswer:
+        """Creates a CacheAnswer object."""
+        return CacheAnswer("cache_ans",key,solution,req_id)
+
+    @classmethod
+    def cache_put(cls,key,solution) -> CacheStore:
+        """Creates a CacheStore object."""
+        return CacheStore("cache_put",key,solution)
+
+    @classmethod
+    def alive(cls,rate=None,counters=None,members=None) -> KeepAlive:
         """Creates a KeepAlive object."""
-        return KeepAlive("alive")
+        return KeepAlive("alive",rate,counters,members)
+
+    @classmethod
+    def ping(cls,requester=None) -> Ping:
+        """Creates a Ping object."""
+        return Ping("ping",requester)
+
+    @classmethod
+    def ping_req(cls,addr) -> PingRequest:
+        """Creates a PingRequest object."""
+        return PingRequest("ping_req",addr)
+
+    @classmethod
+    def ack(cls,addr,requester=None) -> Ack:
+        """Creates an Ack object."""
+        return Ack("ack",addr,requester)
     
     #@classmethod
     #def sudoku_part(cls,grid):
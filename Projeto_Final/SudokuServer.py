@@ -1,26 +1,35 @@
 import threading
-from http.server import HTTPServer
 import argparse
-from API import api
-from P2PServer import P2PServer
+from API import MAX_SOLVES, APIServer, api
+from P2PServer import SOLVE_TIMEOUT_MS, P2PServer
+from codec import CODECS
+from solver import SOLVERS
 from log import get_logger
 
 HOST = "0.0.0.0"
 
 class Node(threading.Thread):
 
-    def __init__(self, host, httpPort, p2pPort, p2pJoin, handicap):
+    def __init__(self, host, httpPort, p2pPort, p2pJoin, handicap, solver="propagation", workers=1, cache_mb=16, wire="binary", max_solves=MAX_SOLVES,
+                 solve_timeout_ms=SOLVE_TIMEOUT_MS):
         threading.Thread.__init__(self)
         self.host = host
         self.httpPort = httpPort
         self.p2pPort = p2pPort
         self.p2pJoin = p2pJoin
         self.handicap = handicap
+        self.solver = solver
+        self.workers = workers
+        self.cache_mb = cache_mb
+        self.wire = wire
+        self.max_solves = max_solves
+        self.solve_timeout_ms = solve_timeout_ms
         self.logger = get_logger("Node start")
 
     def run(self):
-        p2pNode = P2PServer((self.host, self.p2pPort), self.p2pJoin, self.handicap)
-        http_server = HTTPServer((self.host, self.httpPort), lambda *args, **kwargs: api(p2pNode, *args, **kwargs))
+        p2pNode = P2PServer((self.host, self.p2pPort), self.p2pJoin, self.handicap, solver=self.solver, workers=self.workers, cache_size=self.cache_mb * 1024 * 1024, wire=self.wire,
+                            solve_timeout_ms=self.solve_timeout_ms)
+        http_server = APIServer((self.host, self.httpPort), lambda *args, **kwargs: api(p2pNode, *args, **kwargs), self.max_solves)
 
         p2p_thread = threading.Thread(target=p2pNode.start)
         p2p_thread.start()
@@ -29,6 +38,7 @@ class Node(threading.Thread):
         http_thread = threading.Thread(target=http_server.serve_forever)
         http_thread.start()
         self.logger.info(f"HTTP Server running on {self.host}:{self.httpPort}")
+        http_thread.join()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -36,11 +46,19 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--p2pPort", help="Porto do protocolo P2P do nó", type=int, default=5007)
     parser.add_argument("-a", "--ancoragem", help="Endereço e porto do nó da rede P2P a que se pretende juntar", nargs=2, default=None)
     parser.add_argument("-hd", "--handicap", help="Handicap/atraso para a função de validação em milisegundos", type=int, default=1)
+    parser.add_argument("-m", "--solver", help="Motor de resolução do sudoku", choices=list(SOLVERS), default="propagation")
+    parser.add_argument("-w", "--workers", help="Número de processos usados pelo nó para resolver o sudoku", type=int, default=1)
+    parser.add_argument("-c", "--cache", help="Memória máxima da cache de soluções em MB", type=int, default=16)
+    parser.add_argument("-f", "--wire", help="Formato preferido das mensagens P2P", choices=CODECS, default="binary")
+    parser.add_argument("-r", "--max-solves", help="Máximo de pedidos de resolução em simultâneo, os restantes recebem 503", type=int, default=MAX_SOLVES)
+    parser.add_argument("-T", "--solve-timeout", help="Prazo em milisegundos dos pedidos sem timeout_ms", type=int, default=SOLVE_TIMEOUT_MS)
 
     args = parser.parse_args()
 
     if args.ancoragem is not None:
-        n = Node(HOST, args.httpPort, args.p2pPort, (args.ancoragem[0], int(args.ancoragem[1])), args.handicap)
+        n = Node(HOST, args.httpPort, args.p2pPort, (args.ancoragem[0], int(args.ancoragem[1])), args.handicap, args.solver, args.workers, args.cache, args.wire, args.max_solves, args.solve_timeout)
     else:
-        n = Node(HOST, args.httpPort, args.p2pPort, None, args.handicap)
+        n = Node(HOST, args.httpPort, args.p2pPort, None, args.handicap, args.solver, args.workers, args.cache, args.wire, args.max_solves, args.solve_timeout)
     n.start()
+    # a thread principal não pode terminar, senão o pool de processos deixa de aceitar trabalho
+    n.join()
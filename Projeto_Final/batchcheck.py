@@ -0,0 +1,48 @@
+"""Batch validation of complete grids for the p2p sudoku solver - Computação Distribuida Project.
+
+check_batch() tells which of many candidate grids are solved sudokus in a few
+vectorized NumPy operations. NumPy is optional: without it the grids are checked one
+at a time in Python.
+"""
+from math import isqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _check(grid):
+    """Scalar check of one grid, without the delays of Sudoku.check()."""
+    size = len(grid)
+    box = isqrt(size)
+    digits = set(range(1, size + 1))
+    units = list(grid)
+    units += [[row[c] for row in grid] for c in range(size)]
+    units += [[grid[br + i][bc + j] for i in range(box) for j in range(box)]
+              for br in range(0, size, box) for bc in range(0, size, box)]
+    return all(len(unit) == size and set(unit) == digits for unit in units)
+
+
+def check_batch(grids):
+    """Which of 'grids' are solved sudokus.
+
+    'grids' is an (N, size, size) uint8 array or a list of N grids of the same size.
+    With NumPy the answer is a boolean array of length N, otherwise a list of bools.
+    """
+    if np is None:
+        return [_check(grid) for grid in grids]
+    cells = np.asarray(grids, dtype=np.uint8)
+    if cells.ndim != 3 or cells.shape[1] != cells.shape[2] or isqrt(cells.shape[1]) ** 2 != cells.shape[1]:
+        raise ValueError(f"Expected an (N, size, size) array of square size, got shape {cells.shape}")
+    count, size = cells.shape[0], cells.shape[1]
+    box = isqrt(size)
+    boxes = cells.reshape(count, box, box, box, box).transpose(0, 1, 3, 2, 4).reshape(count, size, size)
+    # (N, 3*size, size): as linhas, as colunas e as caixas de cada grelha
+    units = np.concatenate((cells, cells.transpose(0, 2, 1), boxes), axis=1)
+    # one-hot de cada dígito num bit: 0 e os valores acima de size ficam fora da máscara
+    onehot = np.left_shift(np.uint64(1), np.minimum(units, size + 1).astype(np.uint64))
+    masks = np.bitwise_or.reduce(onehot, axis=2)
+    # size células com size dígitos diferentes de 1..size são uma permutação
+    full = np.uint64(((1 << size) - 1) << 1)
+    return (masks == full).all(axis=1)
@@ -0,0 +1,243 @@
+"""Benchmarks for the p2p sudoku solver - Computação Distribuida Project."""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import timeit
+import urllib.request
+from fractions import Fraction
+
+import batchcheck
+import codec
+import gen
+from solver import SOLVERS, get_solver
+from sudoku import BitSudoku, Sudoku
+
+HOST = "127.0.0.1"
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+# puzzles difíceis conhecidos, linha a linha com 0 nas células vazias
+HARD_PUZZLES = [
+    "800000000003600000070090200050007000000045700000100030001000068008500010090000400",
+    "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+    "100007090030020008009600500005300900010080002600004000300000010040000007007000300",
+    "000000039000001005003050800008090006070002000100400000009080050020000600400700000",
+    "000003017015009008060000000100007000009000200000500004000000020500600340340200000",
+]
+
+
+def parse_grid(line):
+    """Build a grid (list of rows) from a string with the 81 digits of a sudoku."""
+    return [[int(num) for num in line[row * 9:row * 9 + 9]] for row in range(9)]
+
+
+def wait_port(port, timeout=10):
+    """Wait until something is listening on a local TCP port."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port}")
+
+
+def start_nodes(count, http_port, p2p_port, extra_args=(), settle=2):
+    """Start 'count' SudokuServer processes, all joined through the first one."""
+    procs = []
+    for i in range(count):
+        cmd = [sys.executable, "SudokuServer.py", "-p", str(http_port + i), "-s", str(p2p_port + i), *extra_args]
+        if i:
+            cmd += ["-a", HOST, str(p2p_port)]
+        procs.append(subprocess.Popen(cmd, cwd=DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        wait_port(http_port + i)
+        time.sleep(0.3)
+    # dá tempo à rede para estabilizar as ligações
+    time.sleep(settle)
+    return procs
+
+
+def stop_nodes(procs):
+    for proc in procs:
+        proc.kill()
+    for proc in procs:
+        proc.wait()
+
+
+def post_solve(port, grid, timeout=None):
+    """POST a grid to the /solve endpoint of a node and return the decoded answer."""
+    request = urllib.request.Request(
+        f"http://{HOST}:{port}/solve",
+        data=json.dumps({"sudoku": grid}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def scaling(args):
+    """Solve the hard puzzles with clusters of different sizes and report wall time."""
+    puzzles = [parse_grid(line) for line in HARD_PUZZLES]
+    for count in args.nodes:
+        procs = start_nodes(count, args.http_port, args.p2p_port)
+        try:
+            start = time.time()
+            for grid in puzzles:
+                post_solve(args.http_port, grid)
+            wall = time.time() - start
+        finally:
+            stop_nodes(procs)
+        print(f"{count} nodes: {wall:.2f}s for {len(puzzles)} puzzles ({wall / len(puzzles):.2f}s/puzzle)")
+
+
+def sample_messages():
+    """Typical protocol messages, from the keep-alive to a steal answer with several tasks."""
+    grid = parse_grid(HARD_PUZZLES[0])
+    addr = ("192.168.1.10", 5007)
+    req_id = (42, addr)
+    tasks = [{"req_id": req_id, "address": addr, "sudoku": [row[:] for row in grid], "weight": Fraction(i + 1, 48)}
+             for i in range(8)]
+    return {
+        "alive": {"command": "alive", "rate": 812.5, "counters": {f"192.168.1.{i}:5007": (i + 1, 1000 * i, i) for i in range(8)},
+                  "members": {(f"192.168.1.{i}", 5007): 100 + i for i in range(8)}},
+        "solve_req": {"command": "solve_req", "sudoku": grid, "address": addr, "req_id": req_id,
+                      "is_sub_request": False, "msg_id": (addr, 1234), "ttl": 16},
+        "solve_ans": {"command": "solve_ans", "sudoku": grid, "req_id": req_id, "validations": 1500},
+        "work_done": {"command": "work_done", "req_id": req_id, "weight": Fraction(1, 48), "validations": 37},
+        "steal_ans": {"command": "steal_ans", "tasks": tasks},
+    }
+
+
+def codecs(args):
+    """Compare encode/decode time and size of the binary codec against pickle."""
+    print(f"{'message':<12}{'codec':<8}{'bytes':>7}{'encode ns':>12}{'decode ns':>12}")
+    for name, msg in sample_messages().items():
+        for wire in codec.CODECS:
+            payload = codec.dumps(msg, wire)
+            assert codec.loads(payload, True) == msg
+            encode = min(timeit.repeat(lambda: codec.dumps(msg, wire), number=args.number, repeat=3)) / args.number
+            decode = min(timeit.repeat(lambda: codec.loads(payload, True), number=args.number, repeat=3)) / args.number
+            print(f"{name:<12}{wire:<8}{len(payload):>7}{encode * 1e9:>12.0f}{decode * 1e9:>12.0f}")
+
+
+def sizes(args):
+    """Search time of each engine and wire size of a solve_req for 9x9, 16x16 and 25x25 grids,
+    and optionally the /solve time of a local cluster."""
+    print(f"{'size':<7}{'solver':<13}{'ms/puzzle':>11}{'validations':>13}")
+    puzzles = {}
+    for box in args.boxes:
+        size = box * box
+        puzzles[box] = [gen.generate_sudoku(int(size * size * args.empty), box).grid for _ in range(args.count)]
+        for name in args.solvers:
+            start = time.perf_counter()
+            validations = 0
+            for grid in puzzles[box]:
+                engine = get_solver(name)
+                engine.search([row[:] for row in grid], None)
+                validations += engine.validations
+            elapsed = (time.perf_counter() - start) / args.count
+            print(f"{f'{size}x{size}':<7}{name:<13}{elapsed * 1e3:>11.1f}{validations / args.count:>13.0f}")
+        msg = {"command": "solve_req", "sudoku": puzzles[box][0], "address": (HOST, 5007), "req_id": (1, (HOST, 5007))}
+        print(f"{'':<7}{'wire bytes':<13}{'binary':>11}{len(codec.dumps(msg, codec.BINARY)):>13}")
+        print(f"{'':<7}{'':<13}{'pickle':>11}{len(codec.dumps(msg, codec.PICKLE)):>13}")
+
+    if not args.nodes:
+        return
+    procs = start_nodes(args.nodes, args.http_port, args.p2p_port, ["-hd", "0"])
+    try:
+        for box, grids in puzzles.items():
+            start = time.time()
+            for grid in grids:
+                post_solve(args.http_port, grid)
+            wall = (time.time() - start) / len(grids)
+            print(f"{box * box}x{box * box} with {args.nodes} nodes: {wall:.2f}s/puzzle")
+    finally:
+        stop_nodes(procs)
+
+
+def batch(args):
+    """Grids validated per second by check_batch against one Sudoku.check() at a time."""
+    size = args.box * args.box
+    solved = [gen.generate_sudoku(0, args.box).grid for _ in range(min(args.number, 100))]
+    grids = []
+    for i in range(args.number):
+        grid = [row[:] for row in solved[i % len(solved)]]
+        # metade das grelhas com duas células trocadas, que deixam de ser solução
+        if i % 2:
+            grid[0][0], grid[0][size - 1] = grid[0][size - 1], grid[0][0]
+        grids.append(grid)
+
+    # sem as pausas do limitador, para medir só a validação
+    paths = {
+        "Sudoku": lambda: [Sudoku(g, base_delay=0, threshold=10 ** 12).check() for g in grids],
+        "BitSudoku": lambda: [BitSudoku(g, base_delay=0, threshold=10 ** 12).check() for g in grids],
+        "check_batch": lambda: list(batchcheck.check_batch(grids)),
+    }
+    if batchcheck.np is not None:
+        array = batchcheck.np.array(grids, dtype=batchcheck.np.uint8)
+        paths["check_batch(array)"] = lambda: list(batchcheck.check_batch(array))
+    else:
+        print("NumPy is not installed, check_batch falls back to the scalar check")
+
+    expected = [not i % 2 for i in range(args.number)]
+    print(f"{'path':<20}{'grids/s':>12}{'ok':>5}")
+    for name, run in paths.items():
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print(f"{name:<20}{args.number / elapsed:>12.0f}{str(run() == expected):>5}")
+
+
+def limiter(args):
+    """Per-call cost of Sudoku._limit_calls as the number of validations grows."""
+    # limiar enorme para medir só a contabilidade, sem as pausas do limitador
+    puzzle = Sudoku(parse_grid(HARD_PUZZLES[0]), interval=args.interval, threshold=10 ** 12)
+    batch = args.calls // args.batches
+    print(f"{'calls':>10}{'ns/call':>10}{'window':>9}")
+    for i in range(1, args.batches + 1):
+        start = time.perf_counter()
+        for _ in range(batch):
+            puzzle._limit_calls(None, None, None)
+        cost = (time.perf_counter() - start) / batch
+        print(f"{i * batch:>10}{cost * 1e9:>10.0f}{len(puzzle.recent_requests):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    scaling_parser = sub.add_parser("scaling", help="Tempo de resolução com 1, 2, 4 e 8 nós locais")
+    scaling_parser.add_argument("-n", "--nodes", help="Números de nós a testar", type=int, nargs="+", default=[1, 2, 4, 8])
+    scaling_parser.add_argument("-p", "--http-port", help="Primeiro porto HTTP", type=int, default=8100)
+    scaling_parser.add_argument("-s", "--p2p-port", help="Primeiro porto P2P", type=int, default=5100)
+    scaling_parser.set_defaults(func=scaling)
+
+    codec_parser = sub.add_parser("codec", help="Formato binário das mensagens P2P comparado com pickle")
+    codec_parser.add_argument("-n", "--number", help="Repetições de cada medição", type=int, default=10000)
+    codec_parser.set_defaults(func=codecs)
+
+    limiter_parser = sub.add_parser("limiter", help="Custo por chamada do limitador de validações")
+    limiter_parser.add_argument("-n", "--calls", help="Número total de chamadas", type=int, default=2_000_000)
+    limiter_parser.add_argument("-b", "--batches", help="Número de medições", type=int, default=10)
+    limiter_parser.add_argument("-i", "--interval", help="Janela do limitador em segundos", type=float, default=0.1)
+    limiter_parser.set_defaults(func=limiter)
+
+    sizes_parser = sub.add_parser("sizes", help="Motores de resolução e formato das mensagens com grelhas 9x9, 16x16 e 25x25")
+    sizes_parser.add_argument("-b", "--boxes", help="Tamanhos das caixas a testar", type=int, nargs="+", default=[3, 4, 5])
+    sizes_parser.add_argument("-c", "--count", help="Sudokus gerados por tamanho", type=int, default=5)
+    sizes_parser.add_argument("-e", "--empty", help="Fração de células vazias", type=float, default=0.5)
+    sizes_parser.add_argument("-m", "--solvers", help="Motores a testar", nargs="+", choices=[s for s in SOLVERS if s != "random"], default=["propagation", "dlx"])
+    sizes_parser.add_argument("-n", "--nodes", help="Nós locais para medir também o /solve (0 para não medir)", type=int, default=0)
+    sizes_parser.add_argument("-p", "--http-port", help="Primeiro porto HTTP", type=int, default=8100)
+    sizes_parser.add_argument("-s", "--p2p-port", help="Primeiro porto P2P", type=int, default=5100)
+    sizes_parser.set_defaults(func=sizes)
+
+    batch_parser = sub.add_parser("batch", help="Validação vetorizada de muitas grelhas comparada com Sudoku.check()")
+    batch_parser.add_argument("-n", "--number", help="Número de grelhas", type=int, default=10000)
+    batch_parser.add_argument("-b", "--box", help="Tamanho das caixas das grelhas", type=int, default=3)
+    batch_parser.set_defaults(func=batch)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,238 @@
+"""Solution cache for the p2p sudoku solver - Computação Distribuida Project."""
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import permutations
+from math import isqrt
+
+# acima deste número de candidatos empatados a forma canónica não é calculada
+MAX_BEAM = 5000
+# maior grelha reduzida à forma canónica; as maiores ficam com as próprias pistas como
+# chave, pois a pesquisa em feixe esgota o MAX_BEAM com elas
+MAX_CANONICAL_SIZE = 9
+# custo aproximado em bytes de uma entrada, além da chave e da solução
+ENTRY_OVERHEAD = 200
+# pontos de cada nó no anel de hashing consistente
+VIRTUAL_NODES = 16
+
+
+def _label(values, labels, nxt):
+    """Relabel 'values' with the digit labels so far, giving new labels to new digits."""
+    labels = labels[:]
+    out = []
+    for value in values:
+        if value and not labels[value]:
+            labels[value] = nxt
+            nxt += 1
+        out.append(labels[value])
+    return tuple(out), labels, nxt
+
+
+def _best(candidates):
+    """Keep the states whose next chunk is the smallest, None if there are too many."""
+    best, beam = None, []
+    for chunk, state in candidates:
+        if best is None or chunk < best:
+            best, beam = chunk, [state]
+        elif chunk == best:
+            beam.append(state)
+            if len(beam) > MAX_BEAM:
+                return None
+    return beam
+
+
+def canonical_form(grid):
+    """Canonical form of a grid under the sudoku symmetries and the transform to it.
+
+    The symmetries are the transpose, band and stack swaps, row and column swaps inside
+    a band or stack and digit relabeling; the canonical form is the lexicographically
+    smallest grid reachable with them, read row by row. Returns (key, transform), where
+    key is a hash of the canonical grid, or None if the grid can not be canonicalized.
+
+    Grids larger than MAX_CANONICAL_SIZE are their own canonical form (the identity
+    transform), so only repeats of the very same puzzle share their cache entry.
+    """
+    size = len(grid)
+    box = isqrt(size)
+    if box * box != size or any(len(row) != size or not all(0 <= v <= size for v in row) for row in grid):
+        return None
+    if size > MAX_CANONICAL_SIZE:
+        transform = (0, tuple(range(size)), tuple(range(size)), list(range(size + 1)))
+        return hashlib.sha1(_encode(grid)).digest(), transform
+    grids = (grid, [list(col) for col in zip(*grid)])
+
+    # estado: (transposta, linhas escolhidas, colunas escolhidas, etiquetas, próxima etiqueta)
+    beam = [(t, (r,), (), [0] * (size + 1), 1) for t in range(2) for r in range(size)]
+
+    # a primeira linha escolhe a ordem das colunas, um stack de cada vez
+    for _ in range(box):
+        def stacks():
+            for t, rows, cols, labels, nxt in beam:
+                used = {c // box for c in cols}
+                for s in range(box):
+                    if s in used:
+                        continue
+                    for perm in permutations(range(s * box, s * box + box)):
+                        chunk, new_labels, new_nxt = _label([grids[t][rows[0]][c] for c in perm], labels, nxt)
+                        yield chunk, (t, rows, cols + perm, new_labels, new_nxt)
+        beam = _best(stacks())
+        if beam is None:
+            return None
+
+    # as restantes linhas, dentro da banda atual ou a abrir uma nova banda
+    for p in range(1, size):
+        def rows_at():
+            for t, rows, cols, labels, nxt in beam:
+                if p % box:
+                    band = rows[-1] // box
+                    options = [r for r in range(band * box, band * box + box) if r not in rows]
+                else:
+                    used = {r // box for r in rows}
+                    options = [r for r in range(size) if r // box not in used]
+                for r in options:
+                    chunk, new_labels, new_nxt = _label([grids[t][r][c] for c in cols], labels, nxt)
+                    yield chunk, (t, rows + (r,), cols, new_labels, new_nxt)
+        beam = _best(rows_at())
+        if beam is None:
+            return None
+
+    t, rows, cols, labels, nxt = beam[0]
+    # os dígitos que não aparecem na grelha ficam com as etiquetas que sobram
+    for digit in range(1, size + 1):
+        if not labels[digit]:
+            labels[digit] = nxt
+            nxt += 1
+    transform = (t, rows, cols, labels)
+    return hashlib.sha1(_encode(to_canonical(grid, transform))).digest(), transform
+
+
+def to_canonical(grid, transform):
+    """Apply a transform given by canonical_form to a grid."""
+    t, rows, cols, labels = transform
+    g = [list(col) for col in zip(*grid)] if t else grid
+    return [[labels[g[r][c]] for c in cols] for r in rows]
+
+
+def from_canonical(grid, transform):
+    """Undo a transform given by canonical_form."""
+    t, rows, cols, labels = transform
+    inverse = [0] * len(labels)
+    for digit, label in enumerate(labels):
+        inverse[label] = digit
+    size = len(rows)
+    out = [[0] * size for _ in range(size)]
+    for i, r in enumerate(rows):
+        for j, c in enumerate(cols):
+            out[r][c] = inverse[grid[i][j]]
+    return [list(col) for col in zip(*out)] if t else out
+
+
+def _encode(grid):
+    return bytes(value for row in grid for value in row)
+
+
+def _decode(data):
+    size = isqrt(len(data))
+    return [list(data[r * size:r * size + size]) for r in range(size)]
+
+
+def encode_solution(solution, transform):
+    """Solution in the canonical frame of its puzzle, as bytes."""
+    return _encode(to_canonical(solution, transform))
+
+
+def decode_solution(value, transform):
+    """Solution in the frame of a puzzle from the bytes given by encode_solution, None if
+    'value' does not fit the transform."""
+    if not isinstance(value, bytes) or len(value) != len(transform[1]) ** 2:
+        return None
+    return from_canonical(_decode(value), transform)
+
+
+def canonical_solution(value):
+    """Grid in the canonical frame stored as bytes by encode_solution, None if 'value'
+    is not a square number of cells."""
+    if not isinstance(value, bytes) or isqrt(len(value)) ** 2 != len(value):
+        return None
+    return _decode(value)
+
+
+class HashRing:
+    """Consistent hashing of puzzle hashes over the addresses of the nodes."""
+
+    def __init__(self, nodes):
+        self.nodes = sorted(nodes)
+        self.points = sorted(
+            (hashlib.sha1(f"{node[0]}:{node[1]}#{i}".encode("utf-8")).digest(), node)
+            for node in self.nodes
+            for i in range(VIRTUAL_NODES)
+        )
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, key):
+        """Address of the node that owns 'key'."""
+        i = bisect.bisect(self.keys, key) % len(self.keys)
+        return self.points[i][1]
+
+
+class SolutionCache:
+    """LRU cache of sudoku solutions keyed by the canonical form of the puzzle, so that
+    a puzzle equivalent to a solved one is answered by transforming its solution."""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.remote_hits = 0
+        self.lock = threading.Lock()
+
+    def get(self, grid, form, valid=None):
+        """Solution of 'grid' if an equivalent puzzle is cached, None otherwise.
+
+        'form' is canonical_form(grid), computed by the caller off the event loop; a
+        grid without one (None) is a miss, and so is a solution rejected by 'valid'.
+        """
+        value = self.get_key(form[0]) if form is not None else None
+        solution = decode_solution(value, form[1]) if value is not None else None
+        if solution is not None and valid is not None and not valid(solution):
+            solution = None
+        with self.lock:
+            if solution is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return solution
+
+    def put(self, grid, solution, form):
+        """Cache the solution of 'grid', whose canonical_form is 'form', evicting the least
+        recently used entries."""
+        if form is not None:
+            self.put_key(form[0], encode_solution(solution, form[1]))
+
+    def get_key(self, key):
+        """Canonical solution stored under a puzzle hash, None if there is none."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put_key(self, key, value):
+        """Store a canonical solution under a puzzle hash, replacing the one stored before
+        (which may have been rejected as a bad solution)."""
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(key) + len(old) + ENTRY_OVERHEAD
+            self.entries[key] = value
+            self.bytes += len(key) + len(value) + ENTRY_OVERHEAD
+            while self.bytes > self.max_bytes and self.entries:
+                old_key, old_value = self.entries.popitem(last=False)
+                self.bytes -= len(old_key) + len(old_value) + ENTRY_OVERHEAD
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "remote_hits": self.remote_hits,
+                "entries": len(self.entries), "bytes": self.bytes}
@@ -0,0 +1,345 @@
+"""Wire codecs for the p2p sudoku solver - Computação Distribuida Project.
+
+Messages are the dicts built by CDProto. The binary codec packs them into a struct
+header (magic, version, command) followed by tagged values, with the grids packed in
+4 bits per cell (or as few bits as their digits need for grids larger than 9x9), and
+never runs code from the payload like pickle does. Every message can be encoded with it,
+so it is also the codec of the join handshake and of the nodes that are not neighbours.
+Pickle is only read from the peers that negotiated it, as it runs code from the payload.
+"""
+import pickle
+import struct
+from fractions import Fraction
+from itertools import chain
+from math import isqrt
+
+from Protocol import CDProtoBadFormat
+
+BINARY = "binary"
+PICKLE = "pickle"
+CODECS = (BINARY, PICKLE)
+# mensagens da negociação do codec, sempre em binário: ainda não há codec acordado
+HANDSHAKE = ("join_req", "join_ans")
+
+MAGIC = 0xCD
+VERSION = 1
+HEADER = struct.Struct("!BBB")
+
+# stats_req, stats_ans e stats_hist já não são usados, ficam para os ids dos restantes não mudarem
+COMMANDS = (
+    "join_req", "join_ans", "node_down", "node_req", "node_ans", "update", "stats_req", "stats_ans",
+    "stats_hist", "network_req", "network_ans", "solve_req", "work_done", "steal_req", "steal_ans",
+    "solve_ans", "solved", "cache_req", "cache_ans", "cache_put", "alive", "ping", "ping_req", "ack",
+)
+# nomes dos campos das mensagens, enviados como um byte
+FIELDS = (
+    "answer", "NodesNum", "address", "validation", "solved", "req_id", "history", "network", "sudoku",
+    "is_sub_request", "weight", "validations", "tasks", "key", "solution", "msg_id", "ttl", "codecs", "codec",
+    "timeout_ms", "rate", "counters", "members", "requester", "solver",
+)
+COMMAND_IDS = {command: i for i, command in enumerate(COMMANDS)}
+FIELD_IDS = {field: i for i, field in enumerate(FIELDS)}
+
+(NONE, TRUE, FALSE, INT8, INT32, INT64, BIGINT, FLOAT, STR, BYTES,
+ TUPLE, LIST, DICT, FRACTION, GRID, FIELD, WIDE_GRID) = range(17)
+
+INT8_S = struct.Struct("!b")
+INT32_S = struct.Struct("!i")
+INT64_S = struct.Struct("!q")
+FLOAT_S = struct.Struct("!d")
+LENGTH_S = struct.Struct("!I")
+
+
+def _length(out, n):
+    # comprimentos até 254 ocupam um byte
+    if n < 0xFF:
+        out.append(n)
+    else:
+        out.append(0xFF)
+        out += LENGTH_S.pack(n)
+
+
+# tabelas para empacotar dois dígitos por byte e para os voltar a separar
+SHIFT = bytes((byte << 4) & 0xFF for byte in range(256))
+HIGH = bytes(byte >> 4 for byte in range(256))
+LOW = bytes(byte & 0x0F for byte in range(256))
+
+
+def _grid_cells(value):
+    """Cells of 'value' as bytes if it is a square grid of a square size with values up to 255, else None."""
+    size = len(value)
+    if not size or size > 255 or isqrt(size) ** 2 != size:
+        return None
+    if set(map(type, value)) != {list} or set(map(len, value)) != {size}:
+        return None
+    try:
+        return bytes(chain.from_iterable(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(out, value):
+    if -0x80 <= value < 0x80:
+        out.append(INT8)
+        out += INT8_S.pack(value)
+    elif -0x80000000 <= value < 0x80000000:
+        out.append(INT32)
+        out += INT32_S.pack(value)
+    elif -0x8000000000000000 <= value < 0x8000000000000000:
+        out.append(INT64)
+        out += INT64_S.pack(value)
+    else:
+        data = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+        out.append(BIGINT)
+        _length(out, len(data))
+        out += data
+
+
+def _str(out, value):
+    field = FIELD_IDS.get(value)
+    if field is not None:
+        out.append(FIELD)
+        out.append(field)
+    else:
+        data = value.encode("utf-8")
+        out.append(STR)
+        _length(out, len(data))
+        out += data
+
+
+def _bytes(out, value):
+    out.append(BYTES)
+    _length(out, len(value))
+    out += value
+
+
+def _list(out, value):
+    cells = _grid_cells(value) if value and type(value[0]) is list else None
+    if cells is not None and max(cells) > 15:
+        # grelhas 16x16 e 25x25: 5 bits por célula
+        width = max(cells).bit_length()
+        packed = 0
+        for cell in cells:
+            packed = packed << width | cell
+        size = (len(cells) * width + 7) // 8
+        out.append(WIDE_GRID)
+        out.append(len(value))
+        out.append(width)
+        out += (packed << (size * 8 - len(cells) * width)).to_bytes(size, "big")
+        return
+    if cells is not None:
+        # 4 bits por célula, 41 bytes para um sudoku 9x9
+        if len(cells) % 2:
+            cells += b"\0"
+        out.append(GRID)
+        out.append(len(value))
+        size = len(cells) // 2
+        high = int.from_bytes(cells[::2].translate(SHIFT), "big")
+        out += (high | int.from_bytes(cells[1::2], "big")).to_bytes(size, "big")
+        return
+    out.append(LIST)
+    _length(out, len(value))
+    for item in value:
+        _encode(out, item)
+
+
+def _tuple(out, value):
+    out.append(TUPLE)
+    _length(out, len(value))
+    for item in value:
+        _encode(out, item)
+
+
+def _dict(out, value):
+    out.append(DICT)
+    _length(out, len(value))
+    for key, item in value.items():
+        _encode(out, key)
+        _encode(out, item)
+
+
+def _fraction(out, value):
+    out.append(FRACTION)
+    _int(out, value.numerator)
+    _int(out, value.denominator)
+
+
+def _float(out, value):
+    out.append(FLOAT)
+    out += FLOAT_S.pack(value)
+
+
+ENCODERS = {
+    type(None): lambda out, value: out.append(NONE),
+    bool: lambda out, value: out.append(TRUE if value else FALSE),
+    int: _int, float: _float, str: _str, bytes: _bytes,
+    list: _list, tuple: _tuple, dict: _dict, Fraction: _fraction,
+}
+
+
+def _encode(out, value):
+    encoder = ENCODERS.get(type(value))
+    if encoder is None:
+        raise TypeError(f"Can not encode {type(value).__name__}")
+    encoder(out, value)
+
+
+class _Reader:
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos
+
+    def take(self, n):
+        if self.pos + n > len(self.data):
+            raise ValueError("Truncated message")
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise ValueError("Truncated message")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def length(self):
+        n = self.byte()
+        return n if n < 0xFF else LENGTH_S.unpack(self.take(4))[0]
+
+    def value(self):
+        tag = self.byte()
+        if tag >= len(DECODERS):
+            raise ValueError(f"Unknown tag {tag}")
+        return DECODERS[tag](self)
+
+    def int8(self):
+        return INT8_S.unpack(self.take(1))[0]
+
+    def int32(self):
+        return INT32_S.unpack(self.take(4))[0]
+
+    def int64(self):
+        return INT64_S.unpack(self.take(8))[0]
+
+    def bigint(self):
+        return int.from_bytes(self.take(self.length()), "big", signed=True)
+
+    def float(self):
+        return FLOAT_S.unpack(self.take(8))[0]
+
+    def str(self):
+        return self.take(self.length()).decode("utf-8")
+
+    def bytes(self):
+        return bytes(self.take(self.length()))
+
+    def tuple(self):
+        return tuple([self.value() for _ in range(self.length())])
+
+    def list(self):
+        return [self.value() for _ in range(self.length())]
+
+    def dict(self):
+        return {self.value(): self.value() for _ in range(self.length())}
+
+    def fraction(self):
+        return Fraction(self.value(), self.value())
+
+    def grid(self):
+        size = self.byte()
+        packed = self.take((size * size + 1) // 2)
+        cells = bytearray(len(packed) * 2)
+        cells[::2] = packed.translate(HIGH)
+        cells[1::2] = packed.translate(LOW)
+        return [list(cells[r * size:r * size + size]) for r in range(size)]
+
+    def field(self):
+        return FIELDS[self.byte()]
+
+    def wide_grid(self):
+        size = self.byte()
+        width = self.byte()
+        count = size * size
+        nbytes = (count * width + 7) // 8
+        packed = int.from_bytes(self.take(nbytes), "big") >> (nbytes * 8 - count * width)
+        mask = (1 << width) - 1
+        cells = [0] * count
+        for i in range(count - 1, -1, -1):
+            cells[i] = packed & mask
+            packed >>= width
+        return [cells[r * size:r * size + size] for r in range(size)]
+
+
+# descodificador de cada tag, pela ordem das tags
+DECODERS = (
+    lambda reader: None, lambda reader: True, lambda reader: False,
+    _Reader.int8, _Reader.int32, _Reader.int64, _Reader.bigint, _Reader.float, _Reader.str, _Reader.bytes,
+    _Reader.tuple, _Reader.list, _Reader.dict, _Reader.fraction, _Reader.grid, _Reader.field, _Reader.wide_grid,
+)
+
+
+def encode(msg: dict) -> bytes:
+    """Encode a CDProto message with the binary codec."""
+    out = bytearray(HEADER.pack(MAGIC, VERSION, COMMAND_IDS[msg["command"]]))
+    _length(out, len(msg) - 1)
+    for field, value in msg.items():
+        if field != "command":
+            _encode(out, field)
+            _encode(out, value)
+    return bytes(out)
+
+
+def decode(payload: bytes) -> dict:
+    """Decode a message encoded by encode()."""
+    try:
+        magic, version, command = HEADER.unpack_from(payload)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported codec version {version}")
+        reader = _Reader(payload, HEADER.size)
+        msg = {"command": COMMANDS[command]}
+        for _ in range(reader.length()):
+            field = reader.value()
+            msg[field] = reader.value()
+    except (ValueError, IndexError, TypeError, ZeroDivisionError, UnicodeDecodeError, struct.error):
+        raise CDProtoBadFormat(payload)
+    return msg
+
+
+def pack_grid(grid) -> bytes:
+    """A grid alone with the binary codec, for files of puzzles."""
+    out = bytearray()
+    _encode(out, grid)
+    return bytes(out)
+
+
+def unpack_grids(data: bytes) -> list:
+    """The grids of a buffer of pack_grid() results."""
+    reader = _Reader(data, 0)
+    grids = []
+    try:
+        while reader.pos < len(data):
+            grids.append(reader.value())
+    except (ValueError, IndexError, struct.error):
+        raise CDProtoBadFormat(data)
+    return grids
+
+
+def dumps(msg: dict, codec=BINARY) -> bytes:
+    """Encode msg with 'codec'."""
+    if codec == PICKLE:
+        return pickle.dumps(msg)
+    return encode(msg)
+
+
+def loads(payload: bytes, allow_pickle=False) -> dict:
+    """Decode a message encoded by dumps(). Pickle payloads are only decoded with
+    'allow_pickle', otherwise they are rejected like any malformed payload."""
+    if payload[:1] == bytes([MAGIC]):
+        return decode(payload)
+    if not allow_pickle:
+        raise CDProtoBadFormat(payload)
+    try:
+        return pickle.loads(payload)
+    except Exception:
+        # um payload pickle inválido pode levantar quase qualquer exceção
+        raise CDProtoBadFormat(payload)
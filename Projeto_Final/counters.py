@@ -0,0 +1,41 @@
+"""Cluster wide counters for the p2p sudoku solver - Computação Distribuida Project."""
+import threading
+
+
+class ClusterStats:
+    """Validations and solved sudokus of every node, as a CRDT gossiped on the alive
+    heartbeat.
+
+    Each node only changes its own entry, bumping its version on every change, and
+    views are merged entry by entry keeping the highest version. The merge is
+    commutative, associative and idempotent, so every node converges to the same view
+    whatever the order and number of times the heartbeats arrive.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        # nó -> (versão, validações, resolvidos)
+        self.entries = {node: (0, 0, 0)}
+        self.lock = threading.Lock()
+
+    def update(self, validations, solved):
+        """Set the counters of this node."""
+        with self.lock:
+            version, old_validations, old_solved = self.entries[self.node]
+            if (validations, solved) != (old_validations, old_solved):
+                self.entries[self.node] = (version + 1, validations, solved)
+
+    def merge(self, view):
+        """Merge a view received from another node."""
+        with self.lock:
+            for node, entry in view.items():
+                # a entrada deste nó só é alterada por ele
+                if node == self.node:
+                    continue
+                entry = tuple(entry)
+                if node not in self.entries or entry[0] > self.entries[node][0]:
+                    self.entries[node] = entry
+
+    def view(self):
+        with self.lock:
+            return dict(self.entries)
@@ -1,66 +1,263 @@
+import argparse
+import json
+import multiprocessing
+import os
 import random
 import sys
+import time
+from math import isqrt
 from sudoku import Sudoku
+from solver import DLXSolver, bits, full_mask
+import codec
 
+# fração de células vazias de cada dificuldade (36, 45 e 53 num 9x9)
+DIFFICULTY = {"easy": 0.45, "medium": 0.56, "hard": 0.66}
+# grelhas completas tentadas até chegar ao número de células vazias pedido
+MAX_TRIES = 5
+# preenchimentos das caixas da diagonal tentados por grelha completa (com caixas 2x2
+# algumas diagonais não têm solução)
+FILL_TRIES = 100
+# maior lado de grelha em que forced procura com máscaras de bits; sem propagação a
+# procura perde para o DLX em grelhas maiores
+MASK_SEARCH_SIZE = 9
 
-def solve_sudoku(board):
-    """Solve the Sudoku puzzle using backtracking - this is NOT a distributed solution."""
 
-    row, col = None, None
+def generate_sudoku(empty_boxes=0, box=3):
+    """Generate a Sudoku puzzle with box x box squares (9x9 by default, 16x16 with box=4)."""
+    size = box * box
+    # Fill the diagonal squares randomly and solve the rest of the board with DLX
+    board = solved_grid(box)
+
+    # Remove some numbers to create empty boxes
+    for _ in range(min(empty_boxes, size * size)):
+        row, col = random.randint(0, size - 1), random.randint(0, size - 1)
+        while board[row][col] == 0:
+            row, col = random.randint(0, size - 1), random.randint(0, size - 1)
+        board[row][col] = 0
+
+    return Sudoku(board)
+
+
+def solved_grid(box, rng=random):
+    """A random complete grid with box x box squares, without the delays of Sudoku."""
+    size = box * box
+    for _ in range(FILL_TRIES):
+        board = [[0] * size for _ in range(size)]
+        for n in range(0, size, box):
+            nums = rng.sample(range(1, size + 1), size)
+            for i in range(box):
+                for j in range(box):
+                    board[n + i][n + j] = nums.pop()
+        solution = DLXSolver().search(board, None)
+        if solution is not None:
+            return solution
+    raise ValueError(f"Could not complete a {size}x{size} grid from {FILL_TRIES} random diagonals")
+
+
+def dig(solution, blanks, rng=random):
+    """Empty up to 'blanks' cells of a complete grid, in random order, keeping only the
+    removals after which the puzzle still has a single solution.
+
+    The puzzle is unique before each removal, so it stays unique exactly when no
+    solution puts another digit in the emptied cell (see forced).
+    """
+    size = len(solution)
+    puzzle = [row[:] for row in solution]
+    cells = list(range(size * size))
+    rng.shuffle(cells)
+    removed = 0
+    for cell in cells:
+        if removed == blanks:
+            break
+        r, c = divmod(cell, size)
+        puzzle[r][c] = 0
+        if forced(puzzle, r, c, solution[r][c]):
+            removed += 1
+        else:
+            puzzle[r][c] = solution[r][c]
+    return puzzle, removed
 
-    for i in range(9):
-        for j in range(9):
-            if board[i][j] == 0:
-                row, col = (i, j)
-                break
 
-    if row is None or col is None:
-        return True  # No empty spaces left, puzzle is solved
+def forced(puzzle, row, col, num):
+    """True if no solution of 'puzzle' has a digit other than 'num' in the empty cell.
 
-    for num in range(1, 10):
-        sudoku = Sudoku(board, base_delay=0.01, interval=20, threshold=10)
-        if sudoku.check_is_valid(row, col, num):
-            board[row][col] = num
-            if solve_sudoku(board):
+    Decided by the givens of the cell's peers when they leave only 'num', otherwise by a
+    depth first search (bit masks per row, column and box) for a solution that avoids it,
+    or by counting solutions with DLX in grids above MASK_SEARCH_SIZE.
+    """
+    size = len(puzzle)
+    box = isqrt(size)
+    full = full_mask(size)
+    rows, cols, boxes = [0] * size, [0] * size, [0] * size
+    empty = []
+    for r, line in enumerate(puzzle):
+        for c, n in enumerate(line):
+            b = r // box * box + c // box
+            if n:
+                rows[r] |= 1 << n
+                cols[c] |= 1 << n
+                boxes[b] |= 1 << n
+            elif (r, c) != (row, col):
+                empty.append((r, c, b))
+    b = row // box * box + col // box
+    mask = full & ~(rows[row] | cols[col] | boxes[b]) & ~(1 << num)
+    if not mask:
+        return True
+    if size > MASK_SEARCH_SIZE:
+        return DLXSolver().count(puzzle, 2) == 1
+
+    def search(empty):
+        best, best_mask, best_count = None, 0, size + 1
+        for k, (r, c, b) in enumerate(empty):
+            mask = full & ~(rows[r] | cols[c] | boxes[b])
+            count = mask.bit_count()
+            if count < best_count:
+                best, best_mask, best_count = k, mask, count
+                if count <= 1:
+                    break
+        if best is None:
+            return True
+        r, c, b = empty[best]
+        rest = empty[:best] + empty[best + 1:]
+        for bit in bits(best_mask):
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+            found = search(rest)
+            rows[r] ^= bit
+            cols[c] ^= bit
+            boxes[b] ^= bit
+            if found:
                 return True
-            board[row][col] = 0  # Reset if not a solution
+        return False
 
-    return False
+    # a célula começa com os outros dígitos possíveis
+    for bit in bits(mask):
+        rows[row] |= bit
+        cols[col] |= bit
+        boxes[b] |= bit
+        found = search(empty)
+        rows[row] ^= bit
+        cols[col] ^= bit
+        boxes[b] ^= bit
+        if found:
+            return False
+    return True
 
 
-def generate_sudoku(empty_boxes=0):
-    """Generate a Sudoku puzzle."""
-    board = [[0] * 9 for _ in range(9)]
+def shuffle_grids(grids, box, rng=random):
+    """Apply the same random sudoku symmetry (digit relabeling, row and column swaps inside
+    bands and stacks, band and stack swaps, transpose) to every grid in 'grids'.
 
-    # Fill the diagonal 3x3 squares randomly (these don't interfere with each other)
-    for n in range(0, 9, 3):
-        nums = random.sample(range(1, 10), 9)
-        for i in range(3):
-            for j in range(3):
-                board[n + i][n + j] = nums.pop()
+    Symmetries keep the number of solutions and of empty cells, so a unique puzzle gives
+    new unique puzzles for the cost of a copy. They are all equivalent for the canonical
+    form of the solution cache, though.
+    """
+    size = box * box
+    labels = [0] + rng.sample(range(1, size + 1), size)
+    def order():
+        bands = rng.sample(range(box), box)
+        return [band * box + i for band in bands for i in rng.sample(range(box), box)]
+    rows, cols = order(), order()
+    transpose = rng.random() < 0.5
+    out = []
+    for grid in grids:
+        grid = [[labels[grid[r][c]] for c in cols] for r in rows]
+        out.append([list(col) for col in zip(*grid)] if transpose else grid)
+    return out
 
-    # Solve the puzzle (fill the rest of the board)
-    solve_sudoku(board)
 
-    # Remove some numbers to create empty boxes
-    for _ in range(empty_boxes):
-        row, col = random.randint(0, 8), random.randint(0, 8)
-        while board[row][col] == 0:
-            row, col = random.randint(0, 8), random.randint(0, 8)
-        board[row][col] = 0
+def unique_puzzles(job):
+    """Worker of generate_puzzles: puzzles with a single solution made from one complete grid."""
+    box, blanks, variants = job
+    rng = random.Random()
+    best = None
+    for _ in range(MAX_TRIES):
+        solution = solved_grid(box, rng)
+        puzzle, removed = dig(solution, blanks, rng)
+        if best is None or removed > best[2]:
+            best = (puzzle, solution, removed)
+        if removed == blanks:
+            break
+    puzzle, solution, removed = best
+    records = [{"sudoku": puzzle, "solution": solution, "blanks": removed}]
+    for _ in range(variants - 1):
+        puzzle, solution = shuffle_grids((best[0], best[1]), box, rng)
+        records.append({"sudoku": puzzle, "solution": solution, "blanks": removed})
+    return records
 
-    return Sudoku(board)
+
+def generate_puzzles(count, blanks, box=3, workers=None, variants=1):
+    """Yield 'count' puzzles with a single solution and up to 'blanks' empty cells, as
+    dicts with "sudoku", "solution" and "blanks", generated by 'workers' processes.
+
+    Each complete grid is dug into one puzzle and 'variants' - 1 more are made from it
+    with shuffle_grids.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = ((box, blanks, variants) for _ in range(-(-count // variants)))
+    produced = 0
+    if workers == 1:
+        results = map(unique_puzzles, jobs)
+    else:
+        pool = multiprocessing.get_context("spawn").Pool(workers)
+        results = pool.imap_unordered(unique_puzzles, jobs, chunksize=4)
+    try:
+        for records in results:
+            for record in records[:count - produced]:
+                produced += 1
+                yield record
+    finally:
+        if workers != 1:
+            pool.terminate()
+
+
+def write_puzzles(puzzles, out, fmt="ndjson"):
+    """Write puzzles to a binary file: one JSON object per line (NDJSON, as accepted by
+    /solve/batch) or the grids one after the other in the binary codec's grid format,
+    readable with codec.unpack_grids."""
+    written = 0
+    for puzzle in puzzles:
+        if fmt == "ndjson":
+            out.write(json.dumps(puzzle, separators=(",", ":")).encode("utf-8") + b"\n")
+        else:
+            out.write(codec.pack_grid(puzzle["sudoku"]))
+        written += 1
+    return written
 
 
 if __name__ == "__main__":
-    # Generate and print a solved Sudoku puzzle
-    empty_boxes = int(sys.argv[1])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("empty_boxes", help="Número de células vazias", type=int, nargs="?", default=None)
+    parser.add_argument("box", help="Tamanho das caixas (3 para 9x9, 4 para 16x16)", type=int, nargs="?", default=3)
+    parser.add_argument("-n", "--count", help="Gerar N puzzles com solução única para um ficheiro", type=int, default=None)
+    parser.add_argument("-d", "--difficulty", help="Dificuldade, em vez do número de células vazias", choices=list(DIFFICULTY), default=None)
+    parser.add_argument("-o", "--output", help="Ficheiro de saída", default="puzzles.ndjson")
+    parser.add_argument("-f", "--format", help="Formato do ficheiro", choices=("ndjson", "binary"), default="ndjson")
+    parser.add_argument("-w", "--workers", help="Processos usados para gerar", type=int, default=os.cpu_count())
+    parser.add_argument("-v", "--variants", help="Puzzles derivados por simetria de cada grelha gerada (equivalentes para a cache)", type=int, default=1)
+    args = parser.parse_args()
+
+    size = args.box * args.box
+    blanks = args.empty_boxes
+    if args.difficulty is not None:
+        blanks = round(DIFFICULTY[args.difficulty] * size * size)
+    if blanks is None:
+        parser.error("the number of empty cells or a difficulty is required")
 
-    new_puzzle = generate_sudoku(empty_boxes)
+    if args.count is None:
+        # Generate and print a solved Sudoku puzzle
+        new_puzzle = generate_sudoku(blanks, args.box)
 
-    print(new_puzzle)
+        print(new_puzzle)
 
-    print(
-        "curl http://localhost:8001/solve -X POST -H 'Content-Type: application/json' -d '{\"sudoku\": %s}'"
-        % (new_puzzle.grid)
-    )
\ No newline at end of file
+        print(
+            "curl http://localhost:8001/solve -X POST -H 'Content-Type: application/json' -d '{\"sudoku\": %s}'"
+            % (new_puzzle.grid)
+        )
+    else:
+        start = time.time()
+        with open(args.output, "wb") as out:
+            written = write_puzzles(generate_puzzles(args.count, blanks, args.box, args.workers, args.variants), out, args.format)
+        elapsed = time.time() - start
+        print(f"{written} puzzles in {elapsed:.2f}s ({written / elapsed:.0f}/s) -> {args.output}", file=sys.stderr)
\ No newline at end of file
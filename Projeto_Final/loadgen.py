@@ -0,0 +1,255 @@
+"""Load generator for the p2p sudoku solver - Computação Distribuida Project.
+
+Starts a local cluster of SudokuServer nodes, replays a corpus of puzzles against
+/solve, closed loop (a fixed number of clients) or open loop (a fixed arrival rate),
+and writes latency percentiles, throughput, validations and per-node load as JSON.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import codec
+from benchmark import HARD_PUZZLES, HOST, parse_grid, start_nodes, stop_nodes
+
+# tempo (s) para os contadores dos nós chegarem a todos pelas mensagens alive
+SETTLE = 3
+
+
+def load_corpus(path=None):
+    """Puzzles of a corpus file: NDJSON or a JSON array (grids or /solve bodies, e.g. from
+    gen.py -f ndjson) or grids packed by gen.py -f binary. Without a file, the hard
+    puzzles of benchmark.py."""
+    if path is None:
+        return [parse_grid(line) for line in HARD_PUZZLES]
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:1] not in (b"{", b"["):
+        return codec.unpack_grids(data)
+    try:
+        items = json.loads(data)
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in data.splitlines() if line.strip()]
+    return [item["sudoku"] if isinstance(item, dict) else item for item in items]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[max(1, math.ceil(p / 100 * len(values))) - 1]
+
+
+class Client:
+    """Keep-alive HTTP connection to one node, reopened when the node closes it."""
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def solve(self, body):
+        """POST a /solve body and return (status, decoded answer or None)."""
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(HOST, self.port, timeout=self.timeout)
+            try:
+                self.conn.request("POST", "/solve", body, {"Content-Type": "application/json"})
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # ligação keep-alive fechada pelo nó: tenta uma vez numa ligação nova
+                self.close()
+                if attempt:
+                    raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except json.JSONDecodeError:
+            return response.status, None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class LoadTest:
+    """Sends the corpus to the nodes at 'ports', round robin, and records each answer."""
+
+    def __init__(self, ports, corpus, args):
+        self.ports = ports
+        self.corpus = corpus
+        self.args = args
+        self.lock = threading.Lock()
+        self.next = 0
+        self.results = []
+
+    def body(self, index):
+        request = {"sudoku": self.corpus[index % len(self.corpus)]}
+        if self.args.timeout_ms:
+            request["timeout_ms"] = self.args.timeout_ms
+        if self.args.solver:
+            request["solver"] = self.args.solver
+        return json.dumps(request).encode("utf-8")
+
+    def take(self, deadline):
+        """Index of the next request, None when the test is over."""
+        with self.lock:
+            if self.next >= self.args.requests or time.monotonic() >= deadline:
+                return None
+            self.next += 1
+            return self.next - 1
+
+    def send(self, client, index, scheduled):
+        """Send request 'index' and record its latency from 'scheduled' (monotonic)."""
+        try:
+            status, answer = client.solve(self.body(index))
+        except (OSError, http.client.HTTPException):
+            status, answer = None, None
+        latency = time.monotonic() - scheduled
+        validations = answer.get("validations") if isinstance(answer, dict) else None
+        with self.lock:
+            self.results.append({"port": client.port, "status": status, "latency": latency, "validations": validations})
+
+    def closed_loop(self, deadline):
+        """'concurrency' clients, each sending its next request when the last one returns."""
+        def run(i):
+            client = Client(self.ports[i % len(self.ports)], self.args.http_timeout)
+            while (index := self.take(deadline)) is not None:
+                self.send(client, index, time.monotonic())
+            client.close()
+        with ThreadPoolExecutor(self.args.concurrency) as pool:
+            list(pool.map(run, range(self.args.concurrency)))
+
+    def open_loop(self, deadline):
+        """Requests arrive at 'rate' per second (Poisson), whether or not the earlier ones
+        returned. The latency counts from the arrival time, so a slow cluster can not hide
+        its queue (coordinated omission)."""
+        local = threading.local()
+        def run(index, scheduled):
+            if not hasattr(local, "clients"):
+                local.clients = {}
+            port = self.ports[index % len(self.ports)]
+            client = local.clients.setdefault(port, Client(port, self.args.http_timeout))
+            self.send(client, index, scheduled)
+        with ThreadPoolExecutor(self.args.concurrency) as pool:
+            arrival = time.monotonic()
+            while (index := self.take(deadline)) is not None:
+                arrival += random.expovariate(self.args.rate)
+                time.sleep(max(0.0, arrival - time.monotonic()))
+                pool.submit(run, index, arrival)
+
+    def run(self):
+        deadline = time.monotonic() + self.args.duration if self.args.duration else float("inf")
+        start = time.monotonic()
+        if self.args.rate:
+            self.open_loop(deadline)
+        else:
+            self.closed_loop(deadline)
+        return time.monotonic() - start
+
+
+def get_json(port, path):
+    with urllib.request.urlopen(f"http://{HOST}:{port}{path}", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def node_load(ports, p2p_ports, before, after, results):
+    """Requests, validations, cache and HTTP metrics of each node during the test."""
+    def validations(stats, p2p_port):
+        return sum(node["validations"] for node in stats["nodes"] if node["address"].endswith(f":{p2p_port}"))
+    nodes = []
+    for port, p2p_port in zip(ports, p2p_ports):
+        stats = get_json(port, "/stats")
+        nodes.append({
+            "http_port": port,
+            "p2p_port": p2p_port,
+            "requests": sum(1 for r in results if r["port"] == port),
+            "validations": validations(after, p2p_port) - validations(before, p2p_port),
+            "cache": stats["cache"],
+            "http": stats["http"],
+        })
+    return nodes
+
+
+def report(results, elapsed, nodes, args):
+    latencies = sorted(r["latency"] * 1000 for r in results if r["status"] == 200)
+    validations = [r["validations"] for r in results if r["status"] == 200 and r["validations"] is not None]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "config": {
+            "nodes": args.nodes, "concurrency": args.concurrency, "rate": args.rate, "requests": args.requests,
+            "duration": args.duration, "handicap": args.handicap, "solver": args.solver, "workers": args.workers,
+            "timeout_ms": args.timeout_ms, "corpus": args.corpus,
+        },
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "requests": len(results),
+        "ok": len(latencies),
+        "status": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else None, "max": latencies[-1] if latencies else None,
+        },
+        "validations_per_solve": sum(validations) / len(validations) if validations else None,
+        "nodes": nodes,
+    }
+
+
+def main(args):
+    corpus = load_corpus(args.corpus)
+    ports = [args.http_port + i for i in range(args.nodes)]
+    p2p_ports = [args.p2p_port + i for i in range(args.nodes)]
+    extra = ["-hd", str(args.handicap), "-w", str(args.workers)]
+    procs = start_nodes(args.nodes, args.http_port, args.p2p_port, extra)
+    try:
+        before = get_json(ports[0], "/stats")
+        test = LoadTest(ports, corpus, args)
+        elapsed = test.run()
+        # os contadores de validações chegam ao primeiro nó pelas mensagens alive
+        time.sleep(SETTLE)
+        after = get_json(ports[0], "/stats")
+        nodes = node_load(ports, p2p_ports, before, after, test.results)
+    finally:
+        stop_nodes(procs)
+
+    result = report(test.results, elapsed, nodes, args)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    latency = result["latency_ms"]
+    if latency["p50"] is not None:
+        print(f"{result['ok']}/{result['requests']} ok in {elapsed:.2f}s, {result['throughput_rps']:.2f} solves/s, "
+              f"p50 {latency['p50']:.0f}ms p95 {latency['p95']:.0f}ms p99 {latency['p99']:.0f}ms")
+    else:
+        print(f"0/{result['requests']} ok in {elapsed:.2f}s, status {result['status']}")
+    for node in nodes:
+        print(f"  :{node['http_port']} {node['requests']} requests, {node['validations']} validations")
+    print(f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--nodes", help="Número de nós locais", type=int, default=3)
+    parser.add_argument("-i", "--corpus", help="Ficheiro de puzzles (NDJSON ou binário do gen.py), por omissão os puzzles difíceis do benchmark", default=None)
+    parser.add_argument("-n", "--requests", help="Número total de pedidos", type=int, default=50)
+    parser.add_argument("-d", "--duration", help="Duração máxima do teste em segundos (0 sem limite)", type=float, default=0)
+    parser.add_argument("-c", "--concurrency", help="Clientes em simultâneo (em open loop, máximo de pedidos em curso)", type=int, default=4)
+    parser.add_argument("-r", "--rate", help="Pedidos por segundo em open loop (0 para closed loop)", type=float, default=0)
+    parser.add_argument("-hd", "--handicap", help="Handicap dos nós em milisegundos", type=int, default=1)
+    parser.add_argument("-m", "--solver", help="Motor de resolução pedido em cada /solve", default=None)
+    parser.add_argument("-w", "--workers", help="Processos de resolução de cada nó", type=int, default=1)
+    parser.add_argument("-t", "--timeout-ms", help="timeout_ms de cada pedido", type=int, default=None)
+    parser.add_argument("--http-timeout", help="Tempo máximo (s) à espera de cada resposta HTTP", type=float, default=300)
+    parser.add_argument("-p", "--http-port", help="Primeiro porto HTTP", type=int, default=8200)
+    parser.add_argument("-s", "--p2p-port", help="Primeiro porto P2P", type=int, default=5200)
+    parser.add_argument("-o", "--output", help="Ficheiro JSON com os resultados", default="loadgen.json")
+    main(parser.parse_args())
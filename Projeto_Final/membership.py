@@ -0,0 +1,110 @@
+"""Failure detection and cluster membership for the p2p sudoku solver - Computação Distribuida Project."""
+import threading
+
+
+class FailureDetector:
+    """SWIM style detector for the direct neighbours of a node.
+
+    Every message received from a neighbour counts as a sign of life. A neighbour
+    silent for 'suspect_timeout' seconds becomes a suspect and is probed, directly and
+    through other neighbours (ping_req), and a suspect that stays silent for
+    'dead_timeout' more seconds is declared dead.
+    """
+
+    def __init__(self, suspect_timeout, dead_timeout):
+        self.suspect_timeout = suspect_timeout
+        self.dead_timeout = dead_timeout
+        self.last_heard = {}
+        # vizinho -> instante em que passou a suspeito
+        self.suspects = {}
+
+    def heard(self, addr, now):
+        self.last_heard[addr] = now
+        self.suspects.pop(addr, None)
+
+    def check(self, peers, now):
+        """Split the silent peers into the suspects to probe and the dead ones."""
+        probe, dead = [], []
+        for peer in peers:
+            # um vizinho novo tem direito ao prazo completo
+            last = self.last_heard.setdefault(peer, now)
+            if now - last < self.suspect_timeout:
+                continue
+            since = self.suspects.setdefault(peer, now)
+            if now - since >= self.dead_timeout:
+                dead.append(peer)
+            else:
+                probe.append(peer)
+        return probe, dead
+
+    def forget(self, addr):
+        self.last_heard.pop(addr, None)
+        self.suspects.pop(addr, None)
+
+
+class Membership:
+    """Nodes of the network, by gossip of heartbeat counters on the alive messages.
+
+    Every node increments its own heartbeat and merges the views of its neighbours
+    keeping the highest heartbeat of each node. A node whose heartbeat does not grow
+    for 'timeout' seconds, or that a neighbour declared dead, leaves the membership.
+    Its last heartbeat is kept for another 'timeout' seconds so that old gossip can
+    not bring it back, only a newer heartbeat from the node itself.
+    """
+
+    def __init__(self, node, now, timeout):
+        self.node = node
+        self.timeout = timeout
+        # nó -> (heartbeat, instante em que o heartbeat aumentou)
+        self.members = {node: (0, now)}
+        # nó -> (último heartbeat, instante em que foi dado como morto)
+        self.dead = {}
+        self.lock = threading.Lock()
+
+    def beat(self, now):
+        with self.lock:
+            self.members[self.node] = (self.members[self.node][0] + 1, now)
+
+    def view(self):
+        with self.lock:
+            return {node: heartbeat for node, (heartbeat, _) in self.members.items()}
+
+    def add(self, addr, now):
+        """Add a node heard directly, which is alive whatever the gossip says."""
+        with self.lock:
+            if addr not in self.members:
+                heartbeat = self.dead.pop(addr, (0, now))[0]
+                self.members[addr] = (heartbeat, now)
+
+    def merge(self, view, now):
+        """Merge the view of a neighbour."""
+        with self.lock:
+            for node, heartbeat in view.items():
+                node = tuple(node)
+                if node == self.node:
+                    continue
+                if node in self.dead and heartbeat <= self.dead[node][0]:
+                    continue
+                if node not in self.members or heartbeat > self.members[node][0]:
+                    self.members[node] = (heartbeat, now)
+                    self.dead.pop(node, None)
+
+    def remove(self, addr, now):
+        """Declare a node dead."""
+        with self.lock:
+            if addr != self.node and addr in self.members:
+                self.dead[addr] = (self.members.pop(addr)[0], now)
+
+    def expire(self, now):
+        """Drop the nodes whose heartbeat stopped, returning them."""
+        with self.lock:
+            expired = [node for node, (_, since) in self.members.items()
+                       if node != self.node and now - since > self.timeout]
+            for node in expired:
+                self.dead[node] = (self.members.pop(node)[0], now)
+            for node in [node for node, (_, since) in self.dead.items() if now - since > self.timeout]:
+                del self.dead[node]
+            return expired
+
+    def __len__(self):
+        return len(self.members)
@@ -0,0 +1,56 @@
+"""Process pool backend for the p2p sudoku solver - Computação Distribuida Project."""
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from solver import get_solver, partition
+
+# flag de cancelamento partilhada, definida em cada processo pelo _init
+_cancel = None
+
+
+def _init(cancel):
+    global _cancel
+    _cancel = cancel
+
+
+def _solve(solver, handicap, grid):
+    return get_solver(solver, handicap).solve(grid, _cancel)
+
+
+class ProcessSolver:
+    """Splits a sudoku between the worker processes of a pool, so that the search of a
+    node is not serialized by the GIL. It solves one sudoku at a time."""
+
+    def __init__(self, workers, solver="propagation", handicap=0.0, poll=0.05):
+        context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.solver = solver
+        self.handicap = handicap
+        self.poll = poll
+        self.cancel = context.Event()
+        self.pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init, initargs=(self.cancel,))
+
+    def solve(self, grid, stop_event=None, solver=None):
+        """Solve 'grid' like SudokuSolver.solve, adding up the validations of every worker.
+        'solver' overrides the engine of the pool for this grid."""
+        self.cancel.clear()
+        solver = solver or self.solver
+        pending = {self.pool.submit(_solve, solver, self.handicap, part) for part in partition(grid, self.workers)}
+        solution = None
+        validations = 0
+
+        while pending:
+            done, pending = wait(pending, timeout=self.poll, return_when=FIRST_COMPLETED)
+            if stop_event is not None and stop_event.is_set():
+                self.cancel.set()
+            for future in done:
+                result, count = future.result()
+                validations += count
+                if result is not None and solution is None:
+                    solution = result
+                    self.cancel.set()
+        return solution, validations
+
+    def shutdown(self):
+        self.cancel.set()
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,131 @@
+"""Work-stealing scheduler for the p2p sudoku solver - Computação Distribuida Project."""
+import threading
+from collections import deque
+from fractions import Fraction
+
+from solver import partition
+
+
+def new_task(req_id, addr, sudoku, weight=Fraction(1), solver=None):
+    """A sub-problem of request 'req_id', coordinated by the node at 'addr'.
+
+    The weights of all the sub-problems of a request add up to 1, so the coordinator
+    knows the search is over when the weight of the searched ones gets back to 1.
+    'solver' is the engine chosen by the request, None for the one of each node.
+    """
+    return {"req_id": req_id, "address": addr, "sudoku": sudoku, "weight": weight, "solver": solver}
+
+
+def split_task(task, parts):
+    """Split a task into sub-tasks sharing its weight. An empty list means the task is
+    a dead end and a single sub-task means it could not be split."""
+    grids = partition(task["sudoku"], parts)
+    if not grids:
+        return []
+    weight = task["weight"] / len(grids)
+    return [new_task(task["req_id"], task["address"], grid, weight, task.get("solver")) for grid in grids]
+
+
+class WorkQueue:
+    """Deque of the sub-problems waiting to be solved by a node.
+
+    The node takes its work from the right end (the newest and smallest sub-problems)
+    and thieves take the oldest half from the left end.
+    """
+
+    def __init__(self):
+        self.tasks = deque()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def push(self, tasks):
+        with self.lock:
+            self.tasks.extend(tasks)
+        if tasks:
+            self.event.set()
+
+    def pop(self):
+        with self.lock:
+            return self.tasks.pop() if self.tasks else None
+
+    def steal(self, limit=None):
+        """Remove and return half of the pending tasks, at most 'limit' of them."""
+        with self.lock:
+            count = (len(self.tasks) + 1) // 2
+            if limit is not None:
+                count = min(count, limit)
+            return [self.tasks.popleft() for _ in range(count)]
+
+    def drop(self, req_id):
+        """Forget the pending tasks of a finished request."""
+        with self.lock:
+            self.tasks = deque(t for t in self.tasks if t["req_id"] != req_id)
+
+    def wait(self, timeout):
+        """Wait up to 'timeout' seconds for new work."""
+        self.event.wait(timeout)
+        self.event.clear()
+
+
+class CostModel:
+    """Validations per second of this node and of its peers.
+
+    The node measures its own rate while it searches and learns the rates of its peers
+    from their alive messages, so the sub-problems of a request can be shared in
+    proportion to the speed of each node and handicapped nodes do not become stragglers.
+    """
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.local = None
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def measure(self, validations, seconds):
+        """Account a search of this node (moving average of its rate)."""
+        if validations <= 0 or seconds <= 0:
+            return
+        rate = validations / seconds
+        with self.lock:
+            self.local = rate if self.local is None else self.alpha * rate + (1 - self.alpha) * self.local
+
+    def update(self, addr, rate):
+        with self.lock:
+            self.rates[addr] = rate
+
+    def forget(self, addr):
+        with self.lock:
+            self.rates.pop(addr, None)
+
+    def rate(self, addr=None):
+        """Rate of a peer (of this node if addr is None), the average of the known rates
+        while it has not been measured yet."""
+        with self.lock:
+            rate = self.local if addr is None else self.rates.get(addr)
+            if rate is not None:
+                return rate
+            known = list(self.rates.values()) + ([self.local] if self.local is not None else [])
+            return sum(known) / len(known) if known else 1.0
+
+    def shares(self, nodes, count):
+        """Number of sub-problems out of 'count' for each node, in proportion to their
+        rates (largest remainder). None in 'nodes' stands for this node."""
+        rates = [self.rate(node) for node in nodes]
+        total = sum(rates)
+        exact = [count * rate / total for rate in rates]
+        shares = [int(x) for x in exact]
+        by_remainder = sorted(range(len(nodes)), key=lambda i: exact[i] - shares[i], reverse=True)
+        for i in by_remainder[:count - sum(shares)]:
+            shares[i] += 1
+        return dict(zip(nodes, shares))
+
+    def steal_limit(self, pending, thief_rate):
+        """How many of 'pending' sub-problems a thief with 'thief_rate' may take, so
+        that both nodes finish at about the same time (half of them for equal rates)."""
+        if not pending or not thief_rate:
+            return 0
+        own = self.rate()
+        return max(1, round(pending * thief_rate / (thief_rate + own)))
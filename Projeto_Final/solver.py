@@ -0,0 +1,503 @@
+"""Solver engines for the p2p sudoku solver - Computação Distribuida Project."""
+import copy
+import random
+import time
+from collections import deque
+from functools import lru_cache
+from math import isqrt
+
+from batchcheck import check_batch, np
+from sudoku import BitSudoku, Sudoku
+
+# maior grelha aceite, 25x25 (caixas 5x5)
+MAX_SIZE = 25
+# grelhas aleatórias geradas e validadas de uma vez pelo RandomSolver, com NumPy
+RANDOM_BATCH = 256
+# limiar do limitador de Sudoku.check() que nunca é atingido
+UNLIMITED = 10 ** 12
+
+@lru_cache(maxsize=None)
+def grid_tables(size):
+    """Units (rows, columns, boxes) and peers of every cell of a size x size grid."""
+    box = isqrt(size)
+    rows = [tuple(r * size + c for c in range(size)) for r in range(size)]
+    cols = [tuple(r * size + c for r in range(size)) for c in range(size)]
+    boxes = [
+        tuple((br + i) * size + bc + j for i in range(box) for j in range(box))
+        for br in range(0, size, box)
+        for bc in range(0, size, box)
+    ]
+    units = rows + cols + boxes
+    cell_units = [tuple(u for u in units if i in u) for i in range(size * size)]
+    peers = [
+        tuple(sorted(set(j for u in cell_units[i] for j in u) - {i}))
+        for i in range(size * size)
+    ]
+    return cell_units, peers
+
+
+def full_mask(size):
+    """Candidate mask with every digit of a size x size grid (bit d means digit d)."""
+    return ((1 << size) - 1) << 1
+
+
+def bits(mask):
+    """Yield the single-bit masks set in 'mask', lowest digit first."""
+    while mask:
+        bit = mask & -mask
+        yield bit
+        mask ^= bit
+
+
+def eliminate(cells, pending, size):
+    """Apply the (cell, bit) eliminations in 'pending' and propagate them.
+
+    Naive singles remove a solved digit from every peer and hidden singles place a
+    digit that has only one possible cell left in a unit. Returns False on a dead end.
+    """
+    cell_units, peers = grid_tables(size)
+    while pending:
+        i, bit = pending.pop()
+        if not cells[i] & bit:
+            continue
+        cells[i] &= ~bit
+        mask = cells[i]
+        if not mask:
+            return False
+        if not mask & (mask - 1):
+            for p in peers[i]:
+                if cells[p] & mask:
+                    pending.append((p, mask))
+        for unit in cell_units[i]:
+            places = [j for j in unit if cells[j] & bit]
+            if not places:
+                return False
+            if len(places) == 1 and cells[places[0]] != bit:
+                j = places[0]
+                pending.extend((j, other) for other in bits(cells[j] & ~bit))
+    return True
+
+
+def assign(cells, i, bit, size):
+    """Place the digit 'bit' in cell 'i' of 'cells' and propagate the consequences."""
+    return eliminate(cells, [(i, other) for other in bits(cells[i] & ~bit)], size)
+
+
+def candidates(grid):
+    """Candidate masks of every cell after propagating the givens, or None if the
+    givens are contradictory."""
+    size = len(grid)
+    cells = [full_mask(size)] * (size * size)
+    for r, row in enumerate(grid):
+        for c, num in enumerate(row):
+            if num and not assign(cells, r * size + c, 1 << num, size):
+                return None
+    return cells
+
+
+def to_grid(cells, size):
+    """Build a grid (list of rows) from candidate masks, 0 for unsolved cells."""
+    return [
+        [
+            cells[r * size + c].bit_length() - 1
+            if not cells[r * size + c] & (cells[r * size + c] - 1) else 0
+            for c in range(size)
+        ]
+        for r in range(size)
+    ]
+
+
+def most_constrained(cells):
+    """Index of the unsolved cell with fewer candidates (MRV), None if all are solved."""
+    best, best_count = None, None
+    for i, mask in enumerate(cells):
+        if mask & (mask - 1):
+            count = mask.bit_count()
+            if best_count is None or count < best_count:
+                best, best_count = i, count
+                if count == 2:
+                    break
+    return best
+
+
+class SudokuSolver:
+    """Base class of the solver engines used by P2PServer."""
+
+    name = None
+    # engines whose search already ends with a Sudoku.check() skip the final one
+    verify = True
+
+    def __init__(self, handicap=0.0):
+        self.validations = 0
+        self.handicap = handicap
+
+    def validate(self, count=1):
+        """Count 'count' validations, waiting the handicap (s) of the node for each."""
+        self.validations += count
+        if self.handicap:
+            time.sleep(self.handicap * count)
+
+    def solve(self, grid, stop_event=None):
+        """Solve 'grid', returning the solution and the number of validations used.
+
+        The solution is None if the search was stopped or the grid has no solution.
+        """
+        solution = self.search(copy.deepcopy(grid), stop_event)
+        if solution is not None and self.verify:
+            self.validate()
+            # uma única verificação: o atraso do limitador já é contado pelo handicap em validate()
+            if not Sudoku(solution, base_delay=0, threshold=UNLIMITED).check():
+                solution = None
+        return solution, self.validations
+
+    def search(self, grid, stop_event):
+        raise NotImplementedError
+
+
+class RandomSolver(SudokuSolver):
+    """Fills every empty cell with a random value of its row until check() passes.
+
+    With NumPy the random grids are made and validated RANDOM_BATCH at a time by
+    check_batch, and only the one found goes through Sudoku.check().
+    """
+
+    name = "random"
+    verify = np is not None
+
+    def search(self, grid, stop_event):
+        if np is not None:
+            return self.search_batch(grid, stop_event)
+        puzzle = BitSudoku(grid)
+        coords = puzzle.empty_coords()
+        numbers = puzzle.possible_values_by_row()
+
+        while stop_event is None or not stop_event.is_set():
+            for coord in coords:
+                puzzle.set_cell(coord[0], coord[1], random.choice(numbers[coord[0]]))
+            self.validate()
+            if puzzle.check():
+                return puzzle.grid
+        return None
+
+    def search_batch(self, grid, stop_event):
+        size = len(grid)
+        base = np.array(grid, dtype=np.uint8)
+        rows, cols = np.nonzero(base == 0)
+        # valores que faltam em cada linha, uma linha da tabela por linha da grelha
+        numbers = BitSudoku([row[:] for row in grid]).possible_values_by_row()
+        options = np.zeros((size, size), dtype=np.uint8)
+        counts = np.array([len(values) for values in numbers])
+        for r, values in enumerate(numbers):
+            options[r, :len(values)] = values
+        rng = np.random.default_rng()
+
+        while stop_event is None or not stop_event.is_set():
+            picks = (rng.random((RANDOM_BATCH, len(rows))) * counts[rows]).astype(np.intp)
+            batch = np.repeat(base[None], RANDOM_BATCH, axis=0)
+            batch[:, rows, cols] = options[rows, picks]
+            self.validate(RANDOM_BATCH)
+            solved = np.flatnonzero(check_batch(batch))
+            if len(solved):
+                return batch[solved[0]].tolist()
+        return None
+
+
+class PropagationSolver(SudokuSolver):
+    """Naive and hidden singles propagation with MRV ordered backtracking."""
+
+    name = "propagation"
+
+    def search(self, grid, stop_event):
+        size = len(grid)
+        cells = candidates(grid)
+        stack = [cells] if cells is not None else []
+
+        while stack:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            cells = stack.pop()
+            i = most_constrained(cells)
+            if i is None:
+                return to_grid(cells, size)
+            # push in reverse so that the lowest digit is tried first
+            for bit in reversed(list(bits(cells[i]))):
+                self.validate()
+                child = cells[:]
+                if assign(child, i, bit, size):
+                    stack.append(child)
+        return None
+
+
+@lru_cache(maxsize=None)
+def exact_cover(size):
+    """Dancing links of the exact cover problem of an empty size x size grid.
+
+    Column 0 is the root and columns 1..4*size*size the constraints: every cell has a
+    digit, and every row, column and box has every digit once. Candidate 'row' (cell
+    row // size with digit row % size + 1) has its 4 nodes at 'first + 4 * row'. The
+    links are kept in flat lists of ints (left, right, up, down, column of each node)
+    plus the size of each column, instead of one Python object per node.
+    """
+    box = isqrt(size)
+    cells = size * size
+    ncols = 4 * cells
+    left = [ncols] + list(range(ncols))
+    right = list(range(1, ncols + 1)) + [0]
+    up = list(range(ncols + 1))
+    down = list(range(ncols + 1))
+    column = list(range(ncols + 1))
+    count = [0] * (ncols + 1)
+    for row in range(cells * size):
+        cell, d = divmod(row, size)
+        r, c = divmod(cell, size)
+        b = r // box * box + c // box
+        first = len(column)
+        for k, col in enumerate((1 + cell, 1 + cells + r * size + d, 1 + 2 * cells + c * size + d, 1 + 3 * cells + b * size + d)):
+            node = first + k
+            column.append(col)
+            left.append(first + (k - 1) % 4)
+            right.append(first + (k + 1) % 4)
+            up.append(up[col])
+            down.append(col)
+            down[up[col]] = node
+            up[col] = node
+            count[col] += 1
+    return left, right, up, down, column, count, ncols + 1
+
+
+class DLXSolver(SudokuSolver):
+    """Knuth's Algorithm X on dancing links, always branching on the constraint with fewer candidates.
+
+    Besides solving it can enumerate and count every solution of a grid.
+    """
+
+    name = "dlx"
+
+    def search(self, grid, stop_event):
+        return next(self.solutions(grid, stop_event), None)
+
+    def count(self, grid, limit=None, stop_event=None):
+        """Number of solutions of 'grid', stopping at 'limit'."""
+        found = 0
+        for _ in self.solutions(grid, stop_event):
+            found += 1
+            if found == limit:
+                break
+        return found
+
+    def solutions(self, grid, stop_event=None):
+        """Yield every solution of 'grid'."""
+        size = len(grid)
+        left, right, up, down, column, count, first = exact_cover(size)
+        # as listas são alteradas pela pesquisa, a estrutura base fica em cache
+        left, right, up, down, count = left[:], right[:], up[:], down[:], count[:]
+
+        def cover(c):
+            left[right[c]] = left[c]
+            right[left[c]] = right[c]
+            i = down[c]
+            while i != c:
+                j = right[i]
+                while j != i:
+                    up[down[j]] = up[j]
+                    down[up[j]] = down[j]
+                    count[column[j]] -= 1
+                    j = right[j]
+                i = down[i]
+
+        def uncover(c):
+            i = up[c]
+            while i != c:
+                j = left[i]
+                while j != i:
+                    count[column[j]] += 1
+                    up[down[j]] = j
+                    down[up[j]] = j
+                    j = left[j]
+                i = up[i]
+            left[right[c]] = c
+            right[left[c]] = c
+
+        def select(r):
+            j = right[r]
+            while j != r:
+                cover(column[j])
+                j = right[j]
+
+        def unselect(r):
+            j = left[r]
+            while j != r:
+                uncover(column[j])
+                j = left[j]
+
+        # os valores dados escolhem logo as suas linhas
+        covered = set()
+        for r, row in enumerate(grid):
+            for c, num in enumerate(row):
+                if num:
+                    node = first + 4 * ((r * size + c) * size + num - 1)
+                    cols = [column[node + k] for k in range(4)]
+                    if covered.intersection(cols):
+                        return
+                    covered.update(cols)
+                    for col in cols:
+                        cover(col)
+
+        stack = []
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return
+            forward = False
+            if right[0] == 0:
+                solution = [row[:] for row in grid]
+                for node in stack:
+                    cell, d = divmod((node - first) // 4, size)
+                    solution[cell // size][cell % size] = d + 1
+                yield solution
+            else:
+                # coluna com menos candidatos
+                c, j, best = 0, right[0], None
+                while j != 0:
+                    if best is None or count[j] < best:
+                        c, best = j, count[j]
+                        if best < 2:
+                            break
+                    j = right[j]
+                if best:
+                    cover(c)
+                    r = down[c]
+                    self.validate()
+                    select(r)
+                    stack.append(r)
+                    forward = True
+            # volta atrás até encontrar uma linha por tentar
+            while not forward:
+                if not stack:
+                    return
+                r = stack.pop()
+                c = column[r]
+                unselect(r)
+                r = down[r]
+                if r != c:
+                    self.validate()
+                    select(r)
+                    stack.append(r)
+                    forward = True
+                else:
+                    uncover(c)
+
+
+def count_solutions(grid, limit=None):
+    """Number of solutions of 'grid', stopping at 'limit' (2 is enough to check uniqueness)."""
+    if check_grid(grid) is not None:
+        return 0
+    return DLXSolver().count(grid, limit)
+
+
+def partition(grid, parts):
+    """Split 'grid' into at least 'parts' disjoint sub-problems, when possible.
+
+    The most constrained cell of the first pending sub-problem is fixed to each of its
+    candidates until there are enough sub-problems. Each one is returned as a grid with
+    the cells solved by propagation filled in; contradictory givens give an empty list.
+    """
+    size = len(grid)
+    cells = candidates(grid)
+    if cells is None:
+        return []
+    pending = deque([cells])
+    done = []
+    while pending and len(pending) + len(done) < parts:
+        cells = pending.popleft()
+        i = most_constrained(cells)
+        if i is None:
+            done.append(cells)
+            continue
+        for bit in bits(cells[i]):
+            child = cells[:]
+            if assign(child, i, bit, size):
+                pending.append(child)
+    return [to_grid(cells, size) for cells in done + list(pending)]
+
+
+def check_grid(grid):
+    """Reason why 'grid' is not a valid sudoku puzzle, None if it is one.
+
+    The grid must be a square list of rows with a square size up to MAX_SIZE, values
+    between 0 (empty) and the size, and no digit given twice in a row, column or box.
+    """
+    if not isinstance(grid, list) or not grid:
+        return "sudoku must be a non-empty list of rows"
+    size = len(grid)
+    box = isqrt(size)
+    if box * box != size:
+        return f"size {size} is not a square"
+    if size > MAX_SIZE:
+        return f"size {size} is larger than {MAX_SIZE}"
+    for r, row in enumerate(grid):
+        if not isinstance(row, list) or len(row) != size:
+            return f"row {r} does not have {size} cells"
+        for num in row:
+            if isinstance(num, bool) or not isinstance(num, int) or not 0 <= num <= size:
+                return f"row {r} has value {num!r} outside 0..{size}"
+    for name, cells in (
+        ("row", lambda k: grid[k]),
+        ("column", lambda k: [row[k] for row in grid]),
+        ("box", lambda k: [grid[k // box * box + i][k % box * box + j] for i in range(box) for j in range(box)]),
+    ):
+        for k in range(size):
+            given = [num for num in cells(k) if num]
+            if len(given) != len(set(given)):
+                return f"{name} {k} has a repeated digit"
+    return None
+
+
+def is_solution(solution, grid=None):
+    """True if 'solution' is a complete sudoku, keeping the givens of 'grid' if given.
+
+    Used for the solutions that come from other nodes, with an unthrottled check().
+    """
+    if check_grid(solution) is not None:
+        return False
+    if grid is not None and (len(grid) != len(solution) or any(
+            given and given != value for row, solved in zip(grid, solution) for given, value in zip(row, solved))):
+        return False
+    return Sudoku(solution, base_delay=0, threshold=UNLIMITED).check()
+
+
+def preflight(grid):
+    """Cheap checks run by the coordinator before distributing a puzzle.
+
+    Returns a report with the status "invalid" (bad grid or repeated givens, with the
+    reason in "error"), "unsolvable" (propagation reached a dead end), "solved"
+    (propagation alone solved it, the grid is in "solution") or "search".
+    """
+    start = time.perf_counter()
+    report = {"status": "search"}
+    error = check_grid(grid)
+    if error is not None:
+        report.update(status="invalid", error=error)
+    else:
+        size = len(grid)
+        givens = sum(1 for row in grid for num in row if num)
+        cells = candidates(grid)
+        report["givens"] = givens
+        if cells is None:
+            report["status"] = "unsolvable"
+        else:
+            solution = to_grid(cells, size)
+            report["propagated"] = sum(1 for row in solution for num in row if num) - givens
+            if most_constrained(cells) is None:
+                report.update(status="solved", solution=solution)
+    report["time"] = time.perf_counter() - start
+    return report
+
+
+SOLVERS = {solver.name: solver for solver in (PropagationSolver, DLXSolver, RandomSolver)}
+
+
+def get_solver(name="propagation", handicap=0.0) -> SudokuSolver:
+    """Creates a new solver engine by name, waiting 'handicap' seconds per validation."""
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown solver '{name}', expected one of {list(SOLVERS)}")
+    return SOLVERS[name](handicap)
@@ -0,0 +1,38 @@
+"""Grids shared by the tests."""
+
+PUZZLE = [
+    [8, 0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 3, 6, 0, 0, 0, 0, 0],
+    [0, 7, 0, 0, 9, 0, 2, 0, 0],
+    [0, 5, 0, 0, 0, 7, 0, 0, 0],
+    [0, 0, 0, 0, 4, 5, 7, 0, 0],
+    [0, 0, 0, 1, 0, 0, 0, 3, 0],
+    [0, 0, 1, 0, 0, 0, 0, 6, 8],
+    [0, 0, 8, 5, 0, 0, 0, 1, 0],
+    [0, 9, 0, 0, 0, 0, 4, 0, 0],
+]
+SOLUTION = [
+    [8, 1, 2, 7, 5, 3, 6, 4, 9],
+    [9, 4, 3, 6, 8, 2, 1, 7, 5],
+    [6, 7, 5, 4, 9, 1, 2, 8, 3],
+    [1, 5, 4, 2, 3, 7, 8, 9, 6],
+    [3, 6, 9, 8, 4, 5, 7, 2, 1],
+    [2, 8, 7, 1, 6, 9, 5, 3, 4],
+    [5, 2, 1, 9, 7, 4, 3, 6, 8],
+    [4, 3, 8, 5, 2, 6, 9, 1, 7],
+    [7, 9, 6, 3, 1, 8, 4, 5, 2],
+]
+
+
+def solved_grid(box=3):
+    """A complete grid with box x box squares."""
+    size = box * box
+    return [[(r * box + r // box + c) % size + 1 for c in range(size)] for r in range(size)]
+
+
+def puzzle(box=3):
+    """solved_grid(box) with a cell emptied in every other row."""
+    grid = solved_grid(box)
+    for i in range(0, len(grid), 2):
+        grid[i][(i * 7) % len(grid)] = 0
+    return grid
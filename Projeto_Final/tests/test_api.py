@@ -0,0 +1,73 @@
+"""Tests the HTTP server: keep-alive connections only hold a thread while they are answered."""
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+import API
+
+
+class FakeP2P:
+    def stats(self):
+        return {"all": {"solved": 0, "validations": 0}, "nodes": []}
+
+    def network(self):
+        return {}
+
+
+@pytest.fixture
+def server():
+    # um só thread no pool: qualquer ligação parada que o prendesse bloqueava as outras
+    server = API.APIServer(("127.0.0.1", 0), lambda *args, **kwargs: API.api(FakeP2P(), *args, **kwargs), 1, workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(conn, path="/stats"):
+    conn.request("GET", path)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def test_idle_keepalive_does_not_hold_threads(server):
+    port = server.server_address[1]
+    idle = [http.client.HTTPConnection("127.0.0.1", port, timeout=2) for _ in range(4)]
+    for conn in idle:
+        assert get(conn)[0] == 200
+    start = time.monotonic()
+    monitor = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    assert get(monitor, "/network")[0] == 200
+    assert time.monotonic() - start < 1
+    # as ligações paradas continuam a servir pedidos
+    for conn in idle:
+        assert get(conn)[0] == 200
+    assert server.metrics()["connections"] == 5
+    assert server.metrics()["dispatches"] == 9
+    for conn in idle + [monitor]:
+        conn.close()
+
+
+def test_pipelined_requests(server):
+    with socket.create_connection(server.server_address, timeout=2) as sock:
+        request = b"GET /stats HTTP/1.1\r\nHost: x\r\n\r\n"
+        sock.sendall(request + request + b"GET /network HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    assert data.count(b"HTTP/1.0 200") + data.count(b"HTTP/1.1 200") == 3
+
+
+def test_idle_connections_expire(server, monkeypatch):
+    monkeypatch.setattr(API, "KEEPALIVE_TIMEOUT", 0.2)
+    with socket.create_connection(server.server_address, timeout=2) as sock:
+        sock.sendall(b"GET /stats HTTP/1.1\r\nHost: x\r\n\r\n")
+        time.sleep(0.1)
+        sock.recv(65536)
+        # o servidor fecha a ligação parada
+        assert sock.recv(1) == b""
@@ -0,0 +1,59 @@
+"""Tests the batch validator and the NumPy path of the random engine."""
+import pytest
+from unittest.mock import patch
+
+import solver
+from batchcheck import _check, check_batch
+from sudoku import Sudoku
+from tests.grids import solved_grid
+
+
+def test_check_solved():
+    assert _check(solved_grid())
+    assert _check(solved_grid(2))
+    assert _check(solved_grid(4))
+
+
+def test_check_wrong():
+    grid = solved_grid()
+    grid[0][0], grid[0][1] = grid[0][1], grid[0][0]
+    assert not _check(grid)
+    grid = solved_grid()
+    grid[4][4] = 0
+    assert not _check(grid)
+
+
+def test_check_batch():
+    wrong = solved_grid()
+    wrong[8][8] = wrong[8][7]
+    empty = [[0] * 9 for _ in range(9)]
+    assert list(check_batch([solved_grid(), wrong, empty, solved_grid()])) == [True, False, False, True]
+
+
+def test_check_batch_sizes():
+    for box in (2, 4, 5):
+        wrong = solved_grid(box)
+        wrong[0][0] = box * box + 1
+        assert list(check_batch([wrong, solved_grid(box)])) == [False, True]
+
+
+def test_check_batch_numpy():
+    np = pytest.importorskip("numpy")
+    grids = np.array([solved_grid()] * 3, dtype=np.uint8)
+    grids[1, 2, 3] = 0
+    assert check_batch(grids).tolist() == [True, False, True]
+    with pytest.raises(ValueError):
+        check_batch(np.zeros((2, 9, 8), dtype=np.uint8))
+
+
+def test_random_solver_numpy():
+    """The grid found by check_batch still goes through the official check()."""
+    pytest.importorskip("numpy")
+    grid = solved_grid()
+    grid[0][0] = grid[0][4] = 0
+    engine = solver.RandomSolver()
+    with patch.object(Sudoku, "check", autospec=True, side_effect=Sudoku.check) as check:
+        solution, validations = engine.solve(grid)
+    assert solution == solved_grid()
+    assert check.call_count == 1
+    assert validations % solver.RANDOM_BATCH == 1
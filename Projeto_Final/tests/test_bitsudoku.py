@@ -0,0 +1,60 @@
+"""Tests the bitmask grid of BitSudoku against Sudoku."""
+import pytest
+from unittest.mock import patch
+
+from sudoku import BitSudoku, Sudoku
+from tests.grids import PUZZLE, SOLUTION, solved_grid
+
+
+@pytest.fixture(autouse=True)
+def clock():
+    """No delays from the validation limiter."""
+    with patch("sudoku.time") as clock:
+        clock.time.return_value = 0.0
+        yield clock
+
+
+@pytest.mark.parametrize("cls", [Sudoku, BitSudoku])
+def test_check(cls):
+    assert cls([row[:] for row in SOLUTION]).check()
+    assert cls(solved_grid(4)).check()
+    grid = [row[:] for row in SOLUTION]
+    grid[0][0], grid[1][0] = grid[1][0], grid[0][0]
+    assert not cls(grid).check()
+    assert not cls([row[:] for row in PUZZLE]).check()
+
+
+def test_check_is_valid():
+    bit, plain = BitSudoku([row[:] for row in PUZZLE]), Sudoku([row[:] for row in PUZZLE])
+    for row in range(9):
+        for col in range(9):
+            for num in range(1, 10):
+                assert bit.check_is_valid(row, col, num) == plain.check_is_valid(row, col, num)
+
+
+def test_set_cell():
+    puzzle = BitSudoku([row[:] for row in PUZZLE])
+    for row in range(9):
+        for col in range(9):
+            puzzle.set_cell(row, col, SOLUTION[row][col])
+    assert puzzle.check()
+    puzzle.set_cell(4, 4, 0)
+    assert not puzzle.check()
+
+
+def test_update_row_copies():
+    """A row changed by the caller after update_row does not reach the masks."""
+    puzzle = BitSudoku([row[:] for row in SOLUTION])
+    row = SOLUTION[0][:]
+    puzzle.update_row(0, row)
+    row[0], row[1] = 0, 0
+    assert puzzle.grid[0] == SOLUTION[0]
+    assert puzzle.check()
+
+
+def test_update_column():
+    puzzle = BitSudoku([row[:] for row in PUZZLE])
+    for col in range(9):
+        puzzle.update_column(col, [SOLUTION[row][col] for row in range(9)])
+    assert puzzle.check()
+    assert puzzle.grid == SOLUTION
@@ -0,0 +1,122 @@
+"""Tests the canonical form of puzzles, the solution cache and its hash ring."""
+import hashlib
+import random
+
+from cache import (ENTRY_OVERHEAD, HashRing, SolutionCache, canonical_form, canonical_solution, decode_solution,
+                   from_canonical, to_canonical)
+from tests.grids import PUZZLE, SOLUTION, puzzle, solved_grid
+
+
+def shuffle(grid, rng):
+    """Apply a random sudoku symmetry to a 9x9 grid."""
+    digits = list(range(1, 10))
+    rng.shuffle(digits)
+    relabel = [0] + digits
+    bands = rng.sample(range(3), 3)
+    rows = [b * 3 + r for b in bands for r in rng.sample(range(3), 3)]
+    stacks = rng.sample(range(3), 3)
+    cols = [s * 3 + c for s in stacks for c in rng.sample(range(3), 3)]
+    out = [[relabel[grid[r][c]] for c in cols] for r in rows]
+    return [list(col) for col in zip(*out)] if rng.random() < 0.5 else out
+
+
+def test_canonical_form_is_invariant():
+    rng = random.Random(3)
+    key, _ = canonical_form(PUZZLE)
+    for _ in range(20):
+        assert canonical_form(shuffle(PUZZLE, rng))[0] == key
+
+
+def test_canonical_form_differs():
+    other = [row[:] for row in PUZZLE]
+    other[0][1] = 1
+    assert canonical_form(other)[0] != canonical_form(PUZZLE)[0]
+
+
+def test_canonical_form_bad_grid():
+    assert canonical_form([[0] * 8 for _ in range(8)]) is None
+    assert canonical_form([[10] * 9 for _ in range(9)]) is None
+
+
+def test_transform_round_trip():
+    _, transform = canonical_form(PUZZLE)
+    assert from_canonical(to_canonical(SOLUTION, transform), transform) == SOLUTION
+
+
+def test_large_grids_keyed_by_givens():
+    """Grids above 9x9 are cached as they are, without the symmetries."""
+    for box in (4, 5):
+        key, transform = canonical_form(puzzle(box))
+        assert to_canonical(solved_grid(box), transform) == solved_grid(box)
+        assert canonical_form(puzzle(box))[0] == key
+        assert canonical_form(solved_grid(box))[0] != key
+        cache = SolutionCache()
+        cache.put(puzzle(box), solved_grid(box), (key, transform))
+        assert cache.get(puzzle(box), canonical_form(puzzle(box))) == solved_grid(box)
+
+
+def test_cache_equivalent_puzzle():
+    """The solution of a puzzle answers any puzzle equivalent to it."""
+    rng = random.Random(5)
+    cache = SolutionCache()
+    cache.put(PUZZLE, SOLUTION, canonical_form(PUZZLE))
+    for _ in range(10):
+        state = rng.getstate()
+        grid = shuffle(PUZZLE, rng)
+        rng.setstate(state)
+        assert cache.get(grid, canonical_form(grid)) == shuffle(SOLUTION, rng)
+    empty = [[0] * 9 for _ in range(9)]
+    assert cache.get(empty, canonical_form(empty)) is None
+    assert (cache.hits, cache.misses) == (10, 1)
+
+
+def test_cache_without_form():
+    """A grid without a canonical form is a miss, never canonicalized again by the cache."""
+    cache = SolutionCache()
+    cache.put(PUZZLE, SOLUTION, None)
+    assert cache.get(PUZZLE, None) is None
+    assert (len(cache.entries), cache.misses) == (0, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SolutionCache(max_bytes=3 * (1 + 81 + ENTRY_OVERHEAD))
+    for key in b"abc":
+        cache.put_key(bytes([key]), bytes(81))
+    cache.get_key(b"a")
+    cache.put_key(b"d", bytes(81))
+    assert cache.get_key(b"b") is None
+    assert all(cache.get_key(key) is not None for key in (b"a", b"c", b"d"))
+    assert cache.bytes == 3 * (1 + 81 + ENTRY_OVERHEAD)
+
+
+def test_cache_rejected_solution():
+    """A solution rejected by 'valid' is a miss, and a new put replaces it."""
+    cache = SolutionCache()
+    form = canonical_form(PUZZLE)
+    cache.put(PUZZLE, solved_grid(), form)
+    assert cache.get(PUZZLE, form, lambda solution: solution == SOLUTION) is None
+    cache.put(PUZZLE, SOLUTION, form)
+    assert cache.get(PUZZLE, form, lambda solution: solution == SOLUTION) == SOLUTION
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 1, 1)
+    assert cache.bytes == len(form[0]) + 81 + ENTRY_OVERHEAD
+
+
+def test_decode_bad_value():
+    _, transform = canonical_form(PUZZLE)
+    assert decode_solution(b"\x01" * 80, transform) is None
+    assert decode_solution(None, transform) is None
+    assert canonical_solution(b"\x01" * 80) is None
+    assert canonical_solution(bytes(range(1, 17))) == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12], [13, 14, 15, 16]]
+
+
+def test_hash_ring():
+    nodes = [("127.0.0.1", 5000 + i) for i in range(5)]
+    ring = HashRing(nodes)
+    keys = [hashlib.sha1(bytes([i])).digest() for i in range(50)]
+    owners = [ring.owner(key) for key in keys]
+    # a ordem dos nós não muda o dono de cada chave
+    assert [HashRing(reversed(nodes)).owner(key) for key in keys] == owners
+    assert len(set(owners)) > 1
+    # sem um nó, só as chaves que eram dele mudam de dono
+    smaller = HashRing(nodes[1:])
+    assert all(smaller.owner(key) == owner for key, owner in zip(keys, owners) if owner != nodes[0])
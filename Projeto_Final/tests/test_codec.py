@@ -0,0 +1,107 @@
+"""Tests the binary wire codec."""
+import os
+import pickle
+from fractions import Fraction
+
+import pytest
+
+import codec
+from Protocol import CDProto, CDProtoBadFormat
+from tests.grids import puzzle, solved_grid
+
+ADDR = ("192.168.1.10", 5007)
+REQ_ID = (42, ADDR)
+
+MESSAGES = [
+    CDProto.join_req(codec.CODECS).pickle(),
+    CDProto.join_ans("ACK", 3, codec.BINARY).pickle(),
+    CDProto.node_down(ADDR).pickle(),
+    CDProto.node_req().pickle(),
+    CDProto.node_ans(ADDR).pickle(),
+    CDProto.node_ans(None).pickle(),
+    CDProto.NumUpdate(3).pickle(),
+    CDProto.net_req(ADDR, REQ_ID).pickle(),
+    CDProto.net_ans({"192.168.1.10:5007": ["192.168.1.11:5007"]}, REQ_ID).pickle(),
+    CDProto.solve_req(puzzle(), ADDR, REQ_ID, True, 500).pickle(),
+    CDProto.solve_req(puzzle(4), ADDR, REQ_ID).pickle(),
+    CDProto.solve_req(puzzle(5), ADDR, REQ_ID).pickle(),
+    CDProto.solve_ans(solved_grid(), REQ_ID, 1500).pickle(),
+    CDProto.solve_stop(REQ_ID).pickle(),
+    CDProto.work_done(REQ_ID, Fraction(1, 48), 37).pickle(),
+    CDProto.steal_req(812.5).pickle(),
+    CDProto.steal_ans([{"req_id": REQ_ID, "address": ADDR, "sudoku": puzzle(), "weight": Fraction(i + 1, 48),
+                        "solver": None} for i in range(4)]).pickle(),
+    CDProto.cache_req(b"\x01" * 20, REQ_ID).pickle(),
+    CDProto.cache_ans(b"\x01" * 20, None, REQ_ID).pickle(),
+    CDProto.cache_put(b"\x01" * 20, bytes(81)).pickle(),
+    CDProto.alive(812.5, {"192.168.1.1:5007": (3, 1000, 2)}, {ADDR: 17, ("10.0.0.1", 5000): 2 ** 40}).pickle(),
+    CDProto.ping(ADDR).pickle(),
+    CDProto.ping_req(ADDR).pickle(),
+    CDProto.ack(ADDR, ADDR).pickle(),
+    CDProto.flood(CDProto.solve_stop(REQ_ID).pickle(), (ADDR, 7), 16),
+]
+
+
+class Evil:
+    def __reduce__(self):
+        return os.system, ("false",)
+
+
+@pytest.mark.parametrize("msg", MESSAGES, ids=lambda msg: msg["command"])
+def test_round_trip(msg):
+    payload = codec.dumps(msg, codec.BINARY)
+    assert payload[0] == codec.MAGIC
+    assert codec.loads(payload) == msg
+
+
+@pytest.mark.parametrize("msg", MESSAGES, ids=lambda msg: msg["command"])
+def test_pickle(msg):
+    assert codec.loads(codec.dumps(msg, codec.PICKLE), allow_pickle=True) == msg
+
+
+def test_binary_by_default():
+    assert codec.dumps(MESSAGES[0])[0] == codec.MAGIC
+
+
+def test_pickle_rejected():
+    """Pickle runs code from the payload, so it is only read when allowed."""
+    with pytest.raises(CDProtoBadFormat):
+        codec.loads(pickle.dumps({"command": "alive", "rate": Evil()}))
+    with pytest.raises(CDProtoBadFormat):
+        codec.loads(codec.dumps(MESSAGES[0], codec.PICKLE))
+
+
+@pytest.mark.parametrize("payload", [b"\x80\x04\x95", pickle.dumps(1)[:-1], b"cnonexistent\nthing\n.",
+                                     b"\x80\x04cbuiltins\nlen\n)R.", b"\x80\x04N\x85R."])
+def test_bad_pickle(payload):
+    with pytest.raises(CDProtoBadFormat):
+        codec.loads(payload, allow_pickle=True)
+
+
+def test_unencodable_value():
+    with pytest.raises(TypeError):
+        codec.dumps({"command": "alive", "rate": {1, 2}})
+
+
+def test_unknown_field():
+    msg = {"command": "alive", "unknown": 1}
+    assert codec.loads(codec.dumps(msg)) == msg
+
+
+def test_grids_are_small():
+    """4 bits per cell for 9x9, the digit width for 25x25."""
+    msg = CDProto.solve_ans(solved_grid(), REQ_ID).pickle()
+    assert len(codec.dumps(msg, codec.BINARY)) < len(pickle.dumps(msg)) / 2
+    assert len(codec.pack_grid(solved_grid(5))) < 25 * 25 * 5 // 8 + 8
+
+
+def test_pack_grids():
+    grids = [puzzle(), solved_grid(), puzzle(4), puzzle(5)]
+    assert codec.unpack_grids(b"".join(codec.pack_grid(grid) for grid in grids)) == grids
+
+
+@pytest.mark.parametrize("payload", [b"", b"\xcd", b"\xcd\x01", b"\xcd\x02\x00\x00", b"\xcd\x01\xff\x00",
+                                     codec.encode(MESSAGES[9])[:-3], b"not a message"])
+def test_bad_payload(payload):
+    with pytest.raises(CDProtoBadFormat):
+        codec.loads(payload)
@@ -0,0 +1,54 @@
+"""Tests the dancing links engine and the solution counter."""
+import threading
+
+from solver import DLXSolver, check_grid, count_solutions
+from tests.grids import PUZZLE, SOLUTION, puzzle
+
+
+def test_count_solutions_unique():
+    assert count_solutions(PUZZLE) == 1
+
+
+def test_count_solutions_empty():
+    # número de sudokus 4x4 completos
+    assert count_solutions([[0] * 4 for _ in range(4)]) == 288
+    assert count_solutions([[0] * 4 for _ in range(4)], limit=10) == 10
+
+
+def test_count_solutions_several():
+    grid = [row[:] for row in PUZZLE]
+    grid[0][0] = 0
+    assert count_solutions(grid, limit=2) == 2
+
+
+def test_count_solutions_none():
+    grid = [row[:] for row in PUZZLE]
+    grid[0][8] = 1
+    assert count_solutions(grid) == 0
+    # dígito repetido nas pistas
+    grid[0][1] = 8
+    assert count_solutions(grid) == 0
+
+
+def test_solutions_are_valid():
+    for solution in DLXSolver().solutions([[0] * 4 for _ in range(4)]):
+        assert check_grid(solution) is None
+        assert all(sorted(row) == [1, 2, 3, 4] for row in solution)
+
+
+def test_large_grids():
+    for box in (4, 5):
+        grid = puzzle(box)
+        solution = DLXSolver().search([row[:] for row in grid], None)
+        assert all(v == 0 or solution[r][c] == v for r, row in enumerate(grid) for c, v in enumerate(row))
+        assert check_grid(solution) is None
+
+
+def test_search():
+    assert DLXSolver().search([row[:] for row in PUZZLE], None) == SOLUTION
+
+
+def test_stop_event():
+    stop_event = threading.Event()
+    stop_event.set()
+    assert DLXSolver().count([[0] * 9 for _ in range(9)], stop_event=stop_event) == 0
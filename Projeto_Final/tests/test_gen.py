@@ -0,0 +1,46 @@
+"""Tests the generator of puzzles with a single solution."""
+import random
+
+import gen
+from solver import check_grid, count_solutions
+from tests.grids import PUZZLE, SOLUTION
+
+
+def test_forced_matches_counter():
+    rng = random.Random(7)
+    for _ in range(20):
+        grid = [row[:] for row in PUZZLE]
+        r, c = rng.randrange(9), rng.randrange(9)
+        grid[r][c] = 0
+        # PUZZLE só tem uma solução, por isso basta ver a célula esvaziada
+        assert gen.forced(grid, r, c, SOLUTION[r][c]) == (count_solutions(grid, 2) == 1)
+
+
+def test_dig_keeps_single_solution():
+    rng = random.Random(1)
+    for box, blanks in ((2, 10), (3, 53)):
+        solution = gen.solved_grid(box, rng)
+        puzzle, removed = gen.dig(solution, blanks, rng)
+        assert removed == sum(row.count(0) for row in puzzle) <= blanks
+        assert count_solutions(puzzle, 2) == 1
+        assert all(
+            num in (0, solution[r][c])
+            for r, row in enumerate(puzzle) for c, num in enumerate(row)
+        )
+
+
+def test_dig_large_grid():
+    rng = random.Random(2)
+    solution = gen.solved_grid(4, rng)
+    puzzle, removed = gen.dig(solution, 100, rng)
+    assert removed == 100
+    assert count_solutions(puzzle, 2) == 1
+
+
+def test_generate_puzzles():
+    records = list(gen.generate_puzzles(5, 40, box=3, workers=1, variants=2))
+    assert len(records) == 5
+    for record in records:
+        assert check_grid(record["solution"]) is None
+        assert count_solutions(record["sudoku"], 2) == 1
+        assert sum(row.count(0) for row in record["sudoku"]) == record["blanks"]
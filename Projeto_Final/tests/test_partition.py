@@ -0,0 +1,29 @@
+"""Tests the partitioning of a puzzle into disjoint sub-problems."""
+from solver import get_solver, partition
+from tests.grids import PUZZLE, SOLUTION, solved_grid
+
+
+def keeps_givens(grid, part):
+    return all(v == 0 or part[r][c] == v for r, row in enumerate(grid) for c, v in enumerate(row))
+
+
+def test_partition_parts():
+    parts = partition(PUZZLE, 8)
+    assert len(parts) >= 8
+    assert all(keeps_givens(PUZZLE, part) for part in parts)
+
+
+def test_partition_disjoint():
+    """Exactly one sub-problem holds the solution."""
+    solutions = [get_solver("propagation").search([row[:] for row in part], None) for part in partition(PUZZLE, 16)]
+    assert [solution for solution in solutions if solution is not None] == [SOLUTION]
+
+
+def test_partition_solved():
+    assert partition(solved_grid(), 4) == [solved_grid()]
+
+
+def test_partition_contradiction():
+    puzzle = [row[:] for row in PUZZLE]
+    puzzle[0][8] = 8
+    assert partition(puzzle, 4) == []
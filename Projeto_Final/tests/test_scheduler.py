@@ -0,0 +1,48 @@
+"""Tests the sub-problems of the work-stealing scheduler."""
+from fractions import Fraction
+
+from scheduler import WorkQueue, new_task, split_task
+from tests.grids import PUZZLE, solved_grid
+
+ADDR = ("127.0.0.1", 5000)
+REQ_ID = (1, ADDR)
+
+
+def test_split_weights():
+    """The weights of the sub-tasks add up to the weight of the task."""
+    task = new_task(REQ_ID, ADDR, PUZZLE, Fraction(1, 3), "dlx")
+    tasks = split_task(task, 8)
+    assert len(tasks) >= 8
+    assert sum(t["weight"] for t in tasks) == Fraction(1, 3)
+    assert all(t["req_id"] == REQ_ID and t["address"] == ADDR and t["solver"] == "dlx" for t in tasks)
+    # o peso de uma tarefa sem saída volta ao coordenador pelo task_done
+    total = Fraction(0)
+    for t in tasks:
+        subs = split_task(t, 4)
+        total += sum(sub["weight"] for sub in subs) if subs else t["weight"]
+    assert total == Fraction(1, 3)
+
+
+def test_split_dead_end():
+    grid = [row[:] for row in PUZZLE]
+    grid[0][8] = 8
+    assert split_task(new_task(REQ_ID, ADDR, grid), 4) == []
+
+
+def test_split_solved():
+    assert len(split_task(new_task(REQ_ID, ADDR, solved_grid()), 4)) == 1
+
+
+def test_work_queue():
+    queue = WorkQueue()
+    other = (2, ADDR)
+    queue.push([new_task(REQ_ID, ADDR, PUZZLE, Fraction(1, 4)) for _ in range(4)])
+    queue.push([new_task(other, ADDR, PUZZLE)])
+    assert queue.pop()["req_id"] == other
+    queue.push([new_task(other, ADDR, PUZZLE)])
+    # os ladrões levam metade das tarefas, as mais antigas
+    stolen = queue.steal()
+    assert len(stolen) == 3 and all(t["req_id"] == REQ_ID for t in stolen)
+    assert len(queue.steal(limit=1)) == 1
+    queue.drop(other)
+    assert len(queue) == 0 and queue.pop() is None
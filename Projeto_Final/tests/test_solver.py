@@ -0,0 +1,54 @@
+"""Tests the solver engines."""
+from unittest.mock import patch
+
+import pytest
+
+from solver import SOLVERS, get_solver, is_solution
+from tests.grids import PUZZLE, SOLUTION, solved_grid
+
+
+@pytest.mark.parametrize("name", [name for name in SOLVERS if name != "random"])
+def test_engines_solve(name):
+    puzzle = [row[:] for row in PUZZLE]
+    solution, validations = get_solver(name).solve(puzzle)
+    assert solution == SOLUTION
+    assert puzzle == PUZZLE
+    assert validations > 0
+
+
+@pytest.mark.parametrize("name", [name for name in SOLVERS if name != "random"])
+def test_final_check_is_not_throttled(name):
+    """The solution is verified once, without the delays of the validation limiter."""
+    with patch("sudoku.time.sleep") as sleep:
+        get_solver(name).solve(PUZZLE)
+    sleep.assert_not_called()
+
+
+def test_handicap():
+    with patch("solver.time.sleep") as sleep:
+        _, validations = get_solver("propagation", 0.001).solve(PUZZLE)
+    assert sum(call.args[0] for call in sleep.call_args_list) == pytest.approx(validations * 0.001)
+
+
+def test_no_solution():
+    puzzle = [row[:] for row in PUZZLE]
+    puzzle[0][8] = 1
+    for name in SOLVERS:
+        if name != "random":
+            assert get_solver(name).solve(puzzle)[0] is None
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        get_solver("bogus")
+
+
+def test_is_solution():
+    assert is_solution(SOLUTION, PUZZLE)
+    assert is_solution(SOLUTION)
+    assert not is_solution(solved_grid(), PUZZLE)
+    assert is_solution(solved_grid())
+    assert not is_solution(PUZZLE)
+    assert not is_solution(SOLUTION[:8])
+    assert not is_solution(solved_grid(4), PUZZLE)
+    assert not is_solution([[v if v != 9 else 10 for v in row] for row in SOLUTION])
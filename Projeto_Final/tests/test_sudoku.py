@@ -0,0 +1,55 @@
+"""Tests the validation limiter of Sudoku."""
+import random
+from unittest.mock import patch
+
+from sudoku import Sudoku
+
+
+def old_limit_calls(calls, current_time, base_delay, interval, threshold):
+    """The limiter before the sliding window: every call kept and scanned."""
+    calls.append(current_time)
+    num_requests = len([t for t in calls if current_time - t < interval])
+    if num_requests > threshold:
+        return base_delay * (num_requests - threshold + 1)
+    return None
+
+
+def limit(puzzle, now, *args):
+    """Delay slept by one _limit_calls at time 'now', None if there was none."""
+    with patch("sudoku.time") as clock:
+        clock.time.return_value = now
+        puzzle._limit_calls(*args)
+    return clock.sleep.call_args[0][0] if clock.sleep.called else None
+
+
+def test_limiter_matches_old():
+    """Same delays as the old limiter for random calls with intervals up to the default."""
+    rng = random.Random(7)
+    puzzle = Sudoku([[0] * 9 for _ in range(9)])
+    calls = []
+    now = 1000.0
+    for _ in range(2000):
+        now += rng.expovariate(2)
+        interval = rng.choice([None, 0.5, 2, 10])
+        threshold = rng.choice([None, 3, 5, 8])
+        old = old_limit_calls(calls, now, 0.01, interval or puzzle.interval, threshold or puzzle.threshold)
+        assert limit(puzzle, now, None, interval, threshold) == old
+
+
+def test_limiter_window():
+    """Only the calls of the last 'interval' seconds are kept."""
+    puzzle = Sudoku([[0] * 9 for _ in range(9)], interval=10)
+    for i in range(100):
+        limit(puzzle, float(i), None, None, None)
+    assert len(puzzle.recent_requests) == 10
+
+
+def test_limiter_delay():
+    puzzle = Sudoku([[0] * 9 for _ in range(9)], base_delay=0.5, threshold=2)
+    assert limit(puzzle, 0.0, None, None, None) is None
+    assert limit(puzzle, 0.1, None, None, None) is None
+    assert limit(puzzle, 0.2, None, None, None) == 1.0
+    assert limit(puzzle, 0.3, None, None, None) == 1.5
+    # fora da janela as chamadas antigas deixam de contar
+    assert limit(puzzle, 20.0, None, None, None) is None
+
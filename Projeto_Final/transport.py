@@ -0,0 +1,149 @@
+"""Transport layer for the p2p sudoku solver - Computação Distribuida Project."""
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+# mensagens de controlo da rede, enviadas antes das restantes
+CONTROL_COMMANDS = {"join_req", "join_ans", "node_req", "node_ans", "node_down", "update", "alive",
+                    "ping", "ping_req", "ack"}
+
+CONTROL = 0
+BULK = 1
+
+# tamanho máximo de um datagrama, abaixo do MTU de uma rede ethernet
+DATAGRAM_SIZE = 1400
+# cabeçalho de cada fragmento: id da mensagem, número do fragmento, total de fragmentos
+FRAGMENT_HEADER = struct.Struct("!IHH")
+FRAGMENT_SIZE = DATAGRAM_SIZE - FRAGMENT_HEADER.size
+
+
+def fragment(msg_id, payload):
+    """Split a payload into datagrams of at most DATAGRAM_SIZE bytes."""
+    total = max(1, -(-len(payload) // FRAGMENT_SIZE))
+    if total > 0xFFFF:
+        raise ValueError(f"Message too large: {len(payload)} bytes")
+    return [
+        FRAGMENT_HEADER.pack(msg_id, seq, total) + payload[seq * FRAGMENT_SIZE:(seq + 1) * FRAGMENT_SIZE]
+        for seq in range(total)
+    ]
+
+
+class Outbox:
+    """Outbound message queue with a control lane and a bulk lane.
+
+    Callers never block: messages are queued, or dropped and counted when their lane is
+    full, and the event loop takes them with get_nowait(), control messages first.
+    """
+
+    def __init__(self, max_control=1000, max_bulk=10000):
+        self.lanes = (deque(), deque())
+        self.limits = (max_control, max_bulk)
+        self.dropped = [0, 0]
+        self.sent = [0, 0]
+        self.lock = threading.Lock()
+
+    def put(self, address, msg):
+        """Queue msg to address, returning False if it was dropped."""
+        lane = CONTROL if msg["command"] in CONTROL_COMMANDS else BULK
+        with self.lock:
+            if len(self.lanes[lane]) >= self.limits[lane]:
+                self.dropped[lane] += 1
+                return False
+            self.lanes[lane].append((address, msg))
+        return True
+
+    def get_nowait(self):
+        """Next (address, msg) to send, None if both lanes are empty."""
+        with self.lock:
+            if self.lanes[CONTROL]:
+                lane = CONTROL
+            elif self.lanes[BULK]:
+                lane = BULK
+            else:
+                return None
+            self.sent[lane] += 1
+            return self.lanes[lane].popleft()
+
+    def stats(self):
+        return {
+            "control": {"depth": len(self.lanes[CONTROL]), "sent": self.sent[CONTROL], "dropped": self.dropped[CONTROL]},
+            "bulk": {"depth": len(self.lanes[BULK]), "sent": self.sent[BULK], "dropped": self.dropped[BULK]},
+        }
+
+
+class SeenSet:
+    """Bounded set of the broadcast ids a node has already seen, oldest forgotten first."""
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, msg_id):
+        """Remember msg_id, returning False if it had been seen already."""
+        with self.lock:
+            if msg_id in self.ids:
+                return False
+            self.ids[msg_id] = None
+            if len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+            return True
+
+
+class Reassembler:
+    """Rebuilds the messages split by fragment() from the datagrams of every sender.
+
+    Incomplete messages are kept for at most 'timeout' seconds, and the oldest are
+    dropped when there are more than 'max_pending' of them or they hold more than
+    'max_bytes' bytes.
+    """
+
+    def __init__(self, timeout=5, max_pending=256, max_bytes=16 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        # (endereço, id) -> [instante do primeiro fragmento, total, {número: dados}]
+        self.pending = OrderedDict()
+        self.bytes = 0
+        self.expired = 0
+
+    def add(self, addr, datagram):
+        """Take a datagram from addr, returning the whole message once all of its
+        fragments arrived and None until then."""
+        if len(datagram) < FRAGMENT_HEADER.size:
+            raise ValueError(f"Datagram too short: {len(datagram)} bytes")
+        msg_id, seq, total = FRAGMENT_HEADER.unpack_from(datagram)
+        data = datagram[FRAGMENT_HEADER.size:]
+        if seq >= total:
+            raise ValueError(f"Bad fragment {seq}/{total}")
+        if total == 1:
+            return data
+
+        now = time.monotonic()
+        self.expire(now)
+        key = (addr, msg_id)
+        entry = self.pending.setdefault(key, [now, total, {}])
+        if seq not in entry[2]:
+            entry[2][seq] = data
+            self.bytes += len(data)
+        if len(entry[2]) < entry[1]:
+            while self.pending and (len(self.pending) > self.max_pending or self.bytes > self.max_bytes):
+                self.discard(next(iter(self.pending)))
+            return None
+        parts = self.discard(key)
+        return b"".join(parts[i] for i in range(total))
+
+    def expire(self, now):
+        """Drop the messages whose first fragment arrived more than 'timeout' seconds ago."""
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if now - entry[0] <= self.timeout:
+                break
+            self.discard(key)
+            self.expired += 1
+
+    def discard(self, key):
+        entry = self.pending.pop(key)
+        self.bytes -= sum(len(part) for part in entry[2].values())
+        return entry[2]